@@ -89,6 +89,13 @@ class Batclant:
             raise RuntimeError(f"Failed to set {device}.{function}: {resp.get('message')}")
         return resp.get("result")
 
+    def send_value(self, device: str, function: str, value):
+        """Publish a command without waiting; the server sends no reply."""
+        if not self.connected:
+            return False
+        cmd = {"device": device, "action": function, "value": value, "reply": False}
+        return self.client.publish(self.topic_cmd, json.dumps(cmd)).rc == mqtt.MQTT_ERR_SUCCESS
+
     def get_value(self, device: str, function: str, timeout=2.0):
         """Get a value from a device. Returns the 'result' directly."""
         resp = self._send_command(device, function, value=None, timeout=timeout)
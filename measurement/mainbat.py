@@ -27,6 +27,9 @@ BRIGHT_WHITE = "\033[97m"
 
 file_name="/home/pi/Desktop/prog/riden/data_log.csv"
 set_v_set_initial=57.0
+# Send grid samples for the inverter output calibration; keep in step with
+# INVERTER_CALIBRATION in storage/riden_inverter_server.py
+calibrate_inverter=False
 
 kp = 0.5
 ki = 0.05
@@ -113,6 +116,11 @@ def PtoI(power_kwatts, voltage=set_v_set_initial, max_current=30.0):
     safe_current = round(min(current, max_current),3)
     return safe_current
 
+def observe_grid(power_diff):
+    """Feed the grid reading to the inverter's output calibration (fire-and-forget)."""
+    if not storage.send_value("inverter", "observe_grid", round(power_diff * 1000)):
+        print(f"{YELLOW}Calibration sample dropped: MQTT not connected{RESET}")
+
 def print_status_line(import_p, export_p, power_diff, pid_power, L1, L2, L3,
                       war_power, rid_P_out, current, v_out):
     """Prints a color-coded status line of power flow and system values."""
@@ -164,6 +172,9 @@ def main_loop():
                 continue
             #calcualte power difference
             power_diff = import_p-export_p  if import_p is not None and export_p is not None else 0.0
+            # Teach the inverter's commanded->actual curve while the charger is idle
+            if calibrate_inverter and current == 0.0:
+                observe_grid(power_diff)
             #print(f"Import: {import_p:.3f} kW, Export: {export_p:.3f} kW P_dif: {MAGENTA} {power_diff:.3f} {RESET} kW, L1:{L1:.3f}, L2:{L2:.3f}, L3:{L3:.3f}")
             
             #pid control
@@ -180,6 +191,7 @@ def main_loop():
             #set power to inverter
             if  pid_power >= 0:
                 war_power=round(pid_power*1000)
+                current=0.0
                 storage.safe_set_value("riden", "set_i_set", 0.0)
                 storage.safe_set_value("inverter", "set_power", war_power)
                 #print(f"Setting inverter power to: {YELLOW}{war_power:.2f}{RESET} W")
@@ -0,0 +1,127 @@
+"""Benchmark the Riden driver against the local simulator.
+
+Runs each transport against a pty-backed RidenSimulator and reports
+transactions/s for single register reads, update() latency percentiles
+and the time to recover from a lost serial port.
+
+    python bench_riden.py --seconds 5 --latency 0.002 --drop 0.01 --crc 0.01
+"""
+import argparse
+import json
+import time
+from drivers.riden import Riden, RidenUnavailable
+from drivers.register import Register as R
+from drivers.simulator import RidenSimulator
+
+TRANSPORTS = ("modbus_tk", "lean")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def bench_transactions(riden, seconds):
+    done = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if riden.read(R.V_OUT) is not None:
+            done += 1
+    return done / seconds
+
+
+def bench_update(riden, seconds):
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        riden.update()
+        latencies.append(time.perf_counter() - start)
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_recovery(riden, rounds):
+    """Close the port under the driver and time the next successful read.
+
+    Includes the circuit breaker's jittered backoff before the first
+    reconnect attempt (see --reconnect-min).
+    """
+    times = []
+    for _ in range(rounds):
+        riden.serial.close()
+        start = time.perf_counter()
+        while True:
+            try:
+                if riden.read(R.V_OUT) is not None:
+                    break
+            except RidenUnavailable:
+                time.sleep(0.001)
+        times.append(time.perf_counter() - start)
+    if not times:
+        return None
+    return {"mean_ms": sum(times) / len(times) * 1000, "max_ms": max(times) * 1000}
+
+
+def run(transport, args):
+    sim = RidenSimulator(
+        model_id=args.model, latency=args.latency, drop_rate=args.drop, crc_error_rate=args.crc, seed=1
+    )
+    port = sim.start()
+    riden = Riden(
+        port=port, baudrate=args.baudrate, timeout=args.timeout, transport=transport, port_config=None,
+        reconnect_min=args.reconnect_min,
+    )
+    try:
+        result = {
+            "transport": transport,
+            "transactions_per_s": bench_transactions(riden, args.seconds),
+            "update": bench_update(riden, args.seconds),
+            "recovery": bench_recovery(riden, args.reconnects),
+        }
+        stats = riden.stats()
+        result["errors"] = stats["counters"]
+        result["frames"] = sim.requests
+        result["dropped"] = sim.dropped
+        return result
+    finally:
+        riden.serial.close()
+        sim.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transport", choices=TRANSPORTS + ("both",), default="both")
+    parser.add_argument("--model", type=int, default=60181, help="Device ID the simulator reports")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--timeout", type=float, default=0.1)
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each throughput run")
+    parser.add_argument("--reconnects", type=int, default=5)
+    parser.add_argument("--reconnect-min", type=float, default=0.5, help="First reconnect backoff (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated device response time (s)")
+    parser.add_argument("--drop", type=float, default=0.0, help="Fraction of requests left unanswered")
+    parser.add_argument("--crc", type=float, default=0.0, help="Fraction of responses with a bad CRC")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    transports = TRANSPORTS if args.transport == "both" else (args.transport,)
+    results = [run(transport, args) for transport in transports]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        update, recovery = result["update"], result["recovery"]
+        print(
+            f"{result['transport']:>10}: {result['transactions_per_s']:7.1f} tx/s | "
+            f"update p50 {update['p50_ms']:.2f} ms p95 {update['p95_ms']:.2f} ms p99 {update['p99_ms']:.2f} ms | "
+            + (f"recovery mean {recovery['mean_ms']:.1f} ms max {recovery['max_ms']:.1f} ms | " if recovery else "")
+            + f"errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Find the Riden's baud rate and measure link quality at each candidate rate.
+
+    python calibrate_riden.py /dev/ttyUSB0            # measure and apply
+    python calibrate_riden.py /dev/ttyUSB0 --dry-run  # measure only
+
+The unit only answers at the rate selected in its menu. To compare rates
+(e.g. for a longer cable), change it on the panel and run this again; the
+results of every run are kept in the port config.
+"""
+import argparse
+import json
+from drivers.riden import BAUD_RATES, Riden
+
+
+def positive_int(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("port", nargs="?", default="/dev/ttyUSB0")
+    parser.add_argument("--rates", type=int, nargs="+", default=BAUD_RATES)
+    parser.add_argument("--requests", type=positive_int, default=50, help="Reads per rate")
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--dry-run", action="store_true", help="Do not apply or store the best rate")
+    args = parser.parse_args()
+
+    riden = Riden(port=args.port, timeout=args.timeout, connect="lazy")
+    result = riden.calibrate_baudrate(args.rates, args.requests, apply=not args.dry_run)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,10 @@ BAUD = 4800
 TIMEOUT = 0.5
 MAX_POWER = 950
 SEND_INTERVAL = 0.5
+FRAME_RATE = 5.0  # Frames per second while ramping
+SETTLE_TIME = 3.0  # Seconds a command must hold before grid readings teach the calibration
+STEP_MAX_AGE = 5.0  # Seconds; an older grid reading does not count as taken just before a step
+SUMMARY_INTERVAL = 300  # Seconds between stats summary log lines (None for no summary)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -33,6 +37,18 @@ def DetectComPort(baud: int = BAUD, timeout: float = TIMEOUT) -> str:
             continue
     raise RuntimeError("No usable serial ports found.")
 
+def CheckRate(name: str, rate):
+    """Return rate as a float > 0, or None for None; ValueError otherwise."""
+    if rate is None:
+        return None
+    try:
+        rate = float(rate)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {rate!r}") from None
+    if not rate > 0:  # Also rejects NaN
+        raise ValueError(f"{name} must be > 0, got {rate}")
+    return rate
+
 # -----------------------------
 # MAIN CLASS
 # -----------------------------
@@ -40,14 +56,42 @@ class InverterController:
     HEADER = [36, 86, 0, 33]
     BYTE6 = 128
 
-    def __init__(self, port=None, baud=BAUD, timeout=TIMEOUT, max_power=MAX_POWER):
+    def __init__(
+        self, port=None, baud=BAUD, timeout=TIMEOUT, max_power=MAX_POWER, ramp_rate=None, frame_rate=FRAME_RATE,
+        calibration=None, summary_interval=None,
+    ):
         self.Port, self.Baud, self.Timeout = port, baud, timeout
         self.MaxPower = max_power
+        # Default slew limit in W/s (None jumps straight to the target) and
+        # the frame rate used to send intermediate setpoints while ramping
+        self.RampRate = CheckRate("ramp_rate", ramp_rate)
+        self.FrameRate = CheckRate("frame_rate", frame_rate) or FRAME_RATE
+        # Optional PowerCalibration: targets are then actual output watts
+        self.Calibration = calibration
+        # Seconds between INFO summary lines of the interval stats (None: never)
+        self.SummaryInterval = summary_interval
         self.SerialConn: Optional[serial.Serial] = None
-        self.CurrentPower = 0
+        self.CurrentPower = 0  # Last power put on the wire
+        self.TargetPower = 0  # Latest setpoint, picked up by the writer
         self.Running = False
         self.Thread: Optional[threading.Thread] = None
         self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = False  # TargetPower changed since the last frame
+        self._target_seq = 0  # Setpoints accepted
+        self._sent_seq = 0  # Setpoints on the wire
+        self._changed_at = 0.0  # time.monotonic() of the last setpoint
+        self._wire_changed_at = 0.0  # time.monotonic() the power on the wire last changed
+        self._ramp = None  # Slew limit for the current target
+        self._grid = None  # (time, command, grid W) of the latest settled grid reading
+        self._step = None  # (time, before, after, grid W before) awaiting its settled response
+        self.Stats = {
+            "frames": 0, "immediate_frames": 0, "keepalive_frames": 0, "ramp_frames": 0, "write_errors": 0,
+            "jitter_max": 0.0, "jitter_total": 0.0, "latency_max": 0.0, "latency_total": 0.0, "energy_wh": 0.0,
+        }
+        self._frame_at = None  # time.monotonic() of the last frame, for the energy integral
+        self._error_run = 0  # Consecutive failed writes; only the first is logged
+        self._interval = self._NewInterval(time.monotonic())
 
     # ---- Connection ----
     def Connect(self):
@@ -68,46 +112,292 @@ class InverterController:
         chk = (264 - b4 - b5) & 0xFF
         return bytes(self.HEADER + [b4, b5, self.BYTE6, chk])
 
-    def SendPower(self, power: int):
+    def SendPower(self, power: int) -> bool:
+        """Write one frame. Only the writer thread calls this while the loop runs."""
         if not self.SerialConn or not self.SerialConn.is_open:
-            logging.error("Serial port not open.")
-            return
+            self._CountError("Serial port not open.")
+            return False
         try:
             packet = self.BuildPacket(power)
             self.SerialConn.write(packet)
             self.SerialConn.flush()
-            with self._lock:
-                self.CurrentPower = power
-            logging.info(f"Sent {power} W")
+            self._CountFrame(power)
+            logging.debug(f"Sent {power} W")
+            return True
         except Exception as e:
-            logging.error(f"Send failed: {e}")
+            self._CountError(f"Send failed: {e}")
+            return False
+
+    # ---- Telemetry ----
+    @staticmethod
+    def _NewInterval(now: float) -> dict:
+        return {"started": now, "frames": 0, "write_errors": 0, "power_min": None, "power_max": None, "energy_wh": 0.0}
+
+    def _CountError(self, message: str):
+        """Count a failed write.
+
+        Only the first of a run is logged; the rest show in write_errors
+        and the summary line.
+        """
+        with self._lock:
+            self.Stats["write_errors"] += 1
+            self._interval["write_errors"] += 1
+            self._error_run += 1
+            first = self._error_run == 1
+        if first:
+            logging.error(f"{message} Further write errors are counted until writes recover.")
+
+    def _CountFrame(self, power: int, ok: bool = True):
+        """Book a frame that reached the wire (``ok``: on every port).
+
+        The energy integral holds the previous power until this frame, as
+        the inverter does.
+        """
+        now = time.monotonic()
+        with self._lock:
+            errors = self._error_run if ok else 0
+            if ok:
+                self._error_run = 0
+            interval = self._interval
+            if self._frame_at is not None:
+                wh = self.CurrentPower * (now - self._frame_at) / 3600
+                self.Stats["energy_wh"] += wh
+                interval["energy_wh"] += wh
+            self._frame_at = now
+            if power != self.CurrentPower:
+                self._wire_changed_at = now
+            self.CurrentPower = power
+            self.Stats["frames"] += 1
+            interval["frames"] += 1
+            interval["power_min"] = power if interval["power_min"] is None else min(interval["power_min"], power)
+            interval["power_max"] = power if interval["power_max"] is None else max(interval["power_max"], power)
+        if errors:
+            logging.info(f"Writes recovered after {errors} failed")
+
+    def _IntervalStats(self, reset: bool) -> dict:
+        """Current interval aggregates; the caller holds the lock.
+
+        power_mean is time weighted (energy over elapsed time), so a short
+        spike between keepalives does not count like a steady hour.
+        """
+        now = time.monotonic()
+        interval = dict(self._interval)
+        started = interval.pop("started")
+        if self._frame_at is not None:
+            # Count the power on the wire up to now
+            wh = self.CurrentPower * (now - self._frame_at) / 3600
+            interval["energy_wh"] += wh
+            if reset:
+                self.Stats["energy_wh"] += wh
+                self._frame_at = now
+        interval["seconds"] = now - started
+        interval["power_mean"] = interval["energy_wh"] * 3600 / interval["seconds"] if interval["seconds"] else None
+        if reset:
+            self._interval = self._NewInterval(now)
+        return interval
 
     # ---- Power Control ----
-    def ModifyPower(self, new_power: int):
-        new_power = max(0, min(new_power, self.MaxPower))
-        self.SendPower(round(new_power))
+    def ModifyPower(self, new_power: int, wait: bool = False, ramp_rate: float = None):
+        """Set a new power target.
+
+        With the control loop running the target goes into the writer's
+        latest-value slot and is on the wire within one frame time; older
+        targets not yet sent are superseded. ``wait`` blocks until it is.
+        Without the loop the frame is sent from the calling thread.
+
+        With a ramp rate (W/s, ``ramp_rate`` or else RampRate) the writer
+        moves there in steps at FrameRate instead of jumping, and ``wait``
+        returns once the first step is sent. A target of 0 always applies at
+        once, so a safety stop is never ramped. A ramp rate that is not a
+        positive number raises ValueError before anything changes.
+
+        With a Calibration, new_power is the wanted AC output and the
+        command sent is taken from the learned curve.
+        """
+        ramp_rate = CheckRate("ramp_rate", ramp_rate)
+        if self.Calibration:
+            new_power = self.Calibration.Commanded(new_power)
+        new_power = round(max(0, min(new_power, self.MaxPower)))
+        self._MarkStep(new_power)
+        if not self.Running:
+            self.SendPower(new_power)
+            return
+        with self._cond:
+            self.TargetPower = new_power
+            self._ramp = (ramp_rate or self.RampRate) if new_power else None
+            self._pending = True
+            self._target_seq += 1
+            self._changed_at = time.monotonic()
+            seq = self._target_seq
+            self._cond.notify_all()
+            if wait:
+                self._cond.wait_for(lambda: self._sent_seq >= seq or not self.Running, timeout=1.0)
 
     def GetCurrentPower(self) -> int:
         """Return the latest sent power value."""
         with self._lock:
             return self.CurrentPower
 
+    def GetExpectedPower(self) -> float:
+        """AC output expected for the power on the wire."""
+        power = self.GetCurrentPower()
+        return self.Calibration.Actual(power) if self.Calibration else power
+
+    def _MarkStep(self, new_power: int):
+        """Pair a command change with the settled grid reading from just before it.
+
+        Any later change replaces the pending step, so a step the control
+        loop moves again before it settles is never learned from.
+        """
+        now = time.monotonic()
+        with self._lock:
+            current = self.TargetPower if self.Running else self.CurrentPower
+            if new_power == current:
+                return
+            grid, self._grid = self._grid, None
+            steady = self.CurrentPower == current
+            if grid and steady and grid[1] == current and now - grid[0] <= STEP_MAX_AGE:
+                self._step = (now, current, new_power, grid[2])
+            else:
+                self._step = None
+
+    def ObserveGrid(self, grid_w: float, settle: float = SETTLE_TIME) -> bool:
+        """Teach the calibration from a grid meter reading (W, import positive).
+
+        Only readings taken once the command on the wire has held for
+        ``settle`` seconds count, so meter lag and ramps are left out. The
+        latest one is kept for the next command change; the first one after
+        a change completes that step response. Returns True when the curve
+        was updated.
+        """
+        if not self.Calibration:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            power, target = self.CurrentPower, self.TargetPower
+            if (self.Running and power != target) or now - self._wire_changed_at < settle:
+                return False
+            self._grid = (now, power, grid_w)
+            step = self._step
+            if not step or step[2] != power:
+                return False
+            self._step = None
+        started, before, after, grid_before = step
+        return self.Calibration.ObserveStep(before, after, grid_before, grid_w, now - started)
+
+    def GetStats(self, reset_interval: bool = False) -> dict:
+        """Frame counts, keepalive jitter and setpoint-to-wire latency (seconds).
+
+        "energy_wh" is the energy commanded since start, "interval" holds
+        frames, write errors, min/mean/max commanded power (W) and energy
+        since the interval started. ``reset_interval`` starts a new one.
+        """
+        with self._lock:
+            interval = self._IntervalStats(reset_interval)
+            stats = dict(self.Stats)
+        keepalives, immediates = stats.pop("keepalive_frames"), stats.pop("immediate_frames")
+        ramps = stats.pop("ramp_frames")
+        jitter_total, latency_total = stats.pop("jitter_total"), stats.pop("latency_total")
+        scheduled = keepalives + ramps
+        stats.update(
+            keepalive_frames=keepalives,
+            ramp_frames=ramps,
+            immediate_frames=immediates,
+            jitter_mean=jitter_total / scheduled if scheduled else None,
+            latency_mean=latency_total / immediates if immediates else None,
+            interval=interval,
+        )
+        return stats
+
+    def LogSummary(self):
+        """Log the interval stats in one INFO line and start a new interval."""
+        with self._lock:
+            s = self._IntervalStats(reset=True)
+        if s["frames"]:
+            power = f"{s['power_min']}/{s['power_mean']:.0f}/{s['power_max']} W min/mean/max"
+        else:
+            power = "no frames"
+        logging.info(
+            f"Inverter last {s['seconds']:.0f} s: {s['frames']} frames, {s['write_errors']} write errors, "
+            f"{power}, {s['energy_wh']:.1f} Wh commanded"
+        )
+
     # ---- Control Loop ----
     def StartControlLoop(self, start_power=0, send_interval=SEND_INTERVAL):
-        """Start sending power periodically in a thread."""
+        """Start the writer thread, the only one writing to the port.
+
+        It sends a new target as soon as ModifyPower() stores it and
+        otherwise repeats the last one on a fixed monotonic schedule every
+        send_interval seconds, so the inverter does not time out. While
+        ramping, frames go out every 1/FrameRate seconds and each advances
+        by the ramp rate times the time actually elapsed, so a late frame
+        does not slow the ramp down.
+        """
         if self.Running:
             logging.warning("Control loop already running.")
             return
 
-        self.Running = True
-        self.CurrentPower = start_power
+        with self._cond:
+            self.Running = True
+            self.TargetPower = round(max(0, min(start_power, self.MaxPower)))
+            self._ramp = None
+            self._pending = True
+            self._target_seq += 1
+            self._changed_at = time.monotonic()
 
         def Loop():
             logging.info("Control loop started")
+            deadline = time.monotonic()
+            commanded = float(self.CurrentPower)  # Unrounded ramp position
+            ramping = False
+            last_sent = deadline
             try:
-                while self.Running:
-                    self.SendPower(self.CurrentPower)
-                    time.sleep(send_interval)
+                while True:
+                    with self._cond:
+                        self._cond.wait_for(
+                            lambda: self._pending or not self.Running,
+                            timeout=max(0.0, deadline - time.monotonic()),
+                        )
+                        if not self.Running:
+                            break
+                        target, immediate, seq, ramp = self.TargetPower, self._pending, self._target_seq, self._ramp
+                        self._pending = False
+                    now = time.monotonic()
+                    was_ramping = ramping
+                    if ramp and target != commanded:
+                        frame_time = 1.0 / self.FrameRate
+                        elapsed = min(now - last_sent, 2 * frame_time) if was_ramping else frame_time
+                        step = ramp * elapsed
+                        commanded += max(-step, min(step, target - commanded))
+                    else:
+                        commanded = target
+                    ramping = commanded != target
+                    self.SendPower(round(commanded))
+                    last_sent = now
+                    with self._cond:
+                        if immediate:
+                            self.Stats["immediate_frames"] += 1
+                            latency = now - self._changed_at
+                            self.Stats["latency_total"] += latency
+                            self.Stats["latency_max"] = max(self.Stats["latency_max"], latency)
+                        else:
+                            self.Stats["ramp_frames" if was_ramping else "keepalive_frames"] += 1
+                            jitter = now - deadline
+                            self.Stats["jitter_total"] += jitter
+                            self.Stats["jitter_max"] = max(self.Stats["jitter_max"], jitter)
+                        # Every frame also serves as keepalive
+                        interval = 1.0 / self.FrameRate if ramping else send_interval
+                        if immediate or ramping != was_ramping:
+                            deadline = now + interval
+                        else:
+                            deadline += interval
+                            if deadline < now:  # Overran, don't burst to catch up
+                                deadline = now + interval
+                        self._sent_seq = seq
+                        self._cond.notify_all()
+                        summary_due = self.SummaryInterval and now - self._interval["started"] >= self.SummaryInterval
+                    if summary_due:
+                        self.LogSummary()
             except KeyboardInterrupt:
                 pass
             finally:
@@ -117,9 +407,12 @@ class InverterController:
         self.Thread.start()
 
     def StopControlLoop(self):
-        if self.Running:
+        with self._cond:
+            if not self.Running:
+                return
             self.Running = False
-            logging.info("Control loop stopped")
+            self._cond.notify_all()
+        logging.info("Control loop stopped")
 
     def ThreadLooping(self, start_power=0, send_interval=SEND_INTERVAL):
         """Public helper to start threaded control loop."""
@@ -127,7 +420,11 @@ class InverterController:
 
     def Stop(self):
         self.StopControlLoop()
+        if self.Thread and self.Thread is not threading.current_thread():
+            self.Thread.join(timeout=1.0)
         self.Disconnect()
+        if self.Calibration:
+            self.Calibration.Save()
 
 # -----------------------------
 # ENTRY POINT
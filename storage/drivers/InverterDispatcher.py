@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import time, logging
+from typing import List, Optional
+from .InverterController import InverterController, FRAME_RATE
+
+# -----------------------------
+# CONFIGURATION
+# -----------------------------
+ROTATE_INTERVAL = 3600  # Seconds between rotations of the fill order
+POLICIES = ("fill", "proportional")
+
+# -----------------------------
+# MAIN CLASS
+# -----------------------------
+class InverterDispatcher(InverterController):
+    """Spread one power target over several inverter channels.
+
+    A channel is one InverterController, i.e. one RS-485 bus. The limiter
+    frame carries no address, so every unit on a bus gets the same frame:
+    ``units`` gives the number of units per channel and the channel's
+    share is divided between them.
+
+    Policies:
+      * "fill": load channels one after another up to their maximum, so
+        units run in their efficient range at low load. The fill order
+        rotates every ``rotate_interval`` seconds so the same unit does not
+        always take the load (or always idle).
+      * "proportional": every channel gets a share in proportion to its
+        maximum power.
+
+    The dispatcher reuses InverterController's single writer thread, ramp
+    and keepalive schedule: each frame it builds every channel's packet
+    first, then writes them back to back and flushes, so all buses switch
+    together. It has the same API as InverterController, so the server
+    and control loop need no changes.
+    """
+
+    def __init__(
+        self, channels: List[InverterController], units: Optional[List[int]] = None, policy="fill",
+        rotate_interval=ROTATE_INTERVAL, ramp_rate=None, frame_rate=FRAME_RATE, summary_interval=None,
+    ):
+        if not channels:
+            raise ValueError("InverterDispatcher needs at least one channel")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}")
+        self.Channels = channels
+        self.Units = list(units or [1] * len(channels))
+        if len(self.Units) != len(channels):
+            raise ValueError(f"units has {len(self.Units)} entries for {len(channels)} channels")
+        if any(not isinstance(n, int) or n < 1 for n in self.Units):
+            raise ValueError(f"units must be positive whole numbers, got {self.Units}")
+        self.Capacities = [ch.MaxPower * n for ch, n in zip(channels, self.Units)]
+        super().__init__(
+            max_power=sum(self.Capacities), ramp_rate=ramp_rate, frame_rate=frame_rate,
+            summary_interval=summary_interval,
+        )
+        self.Policy = policy
+        self.RotateInterval = rotate_interval
+        self.Rotation = 0  # Index of the channel filled first
+        self._rotated_at = time.monotonic()
+        self.ChannelPower = [0] * len(channels)  # Per-unit power last sent on each channel
+
+    # ---- Connection ----
+    def Connect(self):
+        for ch in self.Channels:
+            ch.Connect()
+        logging.info(f"Dispatcher connected to {len(self.Channels)} channels, {self.MaxPower} W total")
+
+    def Disconnect(self):
+        for ch in self.Channels:
+            ch.Disconnect()
+
+    # ---- Dispatch ----
+    def Split(self, power: int) -> List[float]:
+        """Channel shares (W, all units of the channel together) for a total power."""
+        power = max(0, min(power, self.MaxPower))
+        if self.Policy == "proportional":
+            return [power * cap / self.MaxPower for cap in self.Capacities]
+        now = time.monotonic()
+        if self.RotateInterval and now - self._rotated_at >= self.RotateInterval:
+            self.Rotation = (self.Rotation + 1) % len(self.Channels)
+            self._rotated_at = now
+        shares = [0.0] * len(self.Channels)
+        for i in range(len(self.Channels)):
+            index = (self.Rotation + i) % len(self.Channels)
+            shares[index] = min(power, self.Capacities[index])
+            power -= shares[index]
+        return shares
+
+    def BuildFrames(self, power: int) -> tuple:
+        """Per-unit powers and per-channel packets, built before anything is sent.
+
+        Channels with a Calibration get the command for their share of
+        actual output.
+        """
+        powers = [
+            ch.Calibration.Commanded(share / n) if ch.Calibration else round(share / n)
+            for ch, share, n in zip(self.Channels, self.Split(power), self.Units)
+        ]
+        return powers, [ch.BuildPacket(p) for ch, p in zip(self.Channels, powers)]
+
+    def SendPower(self, power: int) -> bool:
+        """Send one aligned frame to every channel."""
+        powers, frames = self.BuildFrames(power)
+        written, ok = [], True
+        for ch, frame in zip(self.Channels, frames):
+            try:
+                ch.SerialConn.write(frame)
+                written.append(ch)
+            except Exception as e:
+                self._CountError(f"Send to {ch.Port} failed: {e}")
+                ok = False
+        for ch in written:
+            try:
+                ch.SerialConn.flush()
+            except Exception as e:
+                self._CountError(f"Flush on {ch.Port} failed: {e}")
+                ok = False
+        self._CountFrame(power, ok)
+        with self._lock:
+            self.ChannelPower = powers
+            for ch, p in zip(self.Channels, powers):
+                if ch in written:
+                    ch.CurrentPower = p
+        logging.debug(f"Sent {power} W as {powers} W per unit")
+        return len(written) == len(self.Channels)
+
+    def GetChannelPower(self) -> List[int]:
+        """Per-unit power last sent on each channel."""
+        with self._lock:
+            return list(self.ChannelPower)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import json, os, logging
+from bisect import bisect_right
+from typing import List, Optional
+
+# -----------------------------
+# CONFIGURATION
+# -----------------------------
+CALIBRATION_PATH = os.path.expanduser("~/.cache/riden/inverter_calibration.json")
+STEP = 50  # W between table points
+LEARNING_RATE = 0.2
+MIN_STEP = 50  # Smallest command change (W) worth learning from
+MAX_GAP = 30.0  # Seconds; slower step responses are not used (house load drifts)
+SAVE_EVERY = 20  # Updates between saves
+
+# -----------------------------
+# MAIN CLASS
+# -----------------------------
+class PowerCalibration:
+    """Learned commanded -> actual AC output curve of an inverter.
+
+    The curve is a piecewise linear table of actual watts at every STEP W
+    of command, anchored at 0 and kept non-decreasing so it can be
+    inverted. It starts as the identity and is learned online from step
+    responses: the settled grid reading just before a command change is
+    compared with the first settled reading after it, and with the house
+    load steady the drop in grid import is the change in actual output.
+    Each observation nudges the table points around both commands
+    (normalised LMS on the interpolation weights).
+    """
+
+    def __init__(self, max_power: int, path: Optional[str] = CALIBRATION_PATH, step=STEP, rate=LEARNING_RATE):
+        self.MaxPower = max_power
+        self.Path = path
+        self.Rate = rate
+        self.Points = list(range(0, max_power, step)) + [max_power]
+        self.Table = [float(p) for p in self.Points]
+        self.Updates = 0
+        self.Load()
+
+    # ---- Curve ----
+    def _weights(self, commanded: float) -> dict:
+        """Table index -> linear interpolation weight for a command."""
+        commanded = max(0, min(commanded, self.MaxPower))
+        i = min(bisect_right(self.Points, commanded), len(self.Points) - 1)
+        lo, hi = self.Points[i - 1], self.Points[i]
+        t = (commanded - lo) / (hi - lo)
+        return {i - 1: 1 - t, i: t}
+
+    def Actual(self, commanded: float) -> float:
+        """Expected AC output for a command."""
+        return sum(self.Table[i] * w for i, w in self._weights(commanded).items())
+
+    def Commanded(self, actual: float) -> int:
+        """Command expected to deliver ``actual`` W (the inverse curve)."""
+        if actual <= 0:
+            return 0
+        table = self.Table
+        if actual >= table[-1]:
+            return self.MaxPower
+        i = bisect_right(table, actual)
+        lo, hi = table[i - 1], table[i]
+        t = (actual - lo) / (hi - lo) if hi > lo else 0.0
+        return round(self.Points[i - 1] + t * (self.Points[i] - self.Points[i - 1]))
+
+    # ---- Learning ----
+    def Observe(self, before: float, after: float, delta_actual: float) -> None:
+        """Learn that changing the command before -> after changed the output by delta_actual W."""
+        weights = self._weights(after)
+        for i, w in self._weights(before).items():
+            weights[i] = weights.get(i, 0.0) - w
+        weights.pop(0, None)  # 0 W command is 0 W output
+        norm = sum(w * w for w in weights.values())
+        if not norm:
+            return
+        error = delta_actual - (self.Actual(after) - self.Actual(before))
+        for i, w in weights.items():
+            self.Table[i] += self.Rate * error * w / norm
+        # Keep the curve non-decreasing and within physical limits
+        for i in range(1, len(self.Table)):
+            self.Table[i] = min(max(self.Table[i], self.Table[i - 1]), self.Points[i] * 1.2)
+        self.Updates += 1
+        if self.Updates % SAVE_EVERY == 0:
+            self.Save()
+
+    def ObserveStep(self, before: int, after: int, grid_before: float, grid_after: float, elapsed: float) -> bool:
+        """Learn from the grid's response to one command step.
+
+        grid_before is the settled grid reading (import positive, W) from
+        just before the command went from before to after, grid_after the
+        first settled reading after it, elapsed seconds later. Steps smaller
+        than MIN_STEP or slower than MAX_GAP are ignored. Returns True when
+        the table was updated.
+        """
+        if abs(after - before) < MIN_STEP or elapsed > MAX_GAP:
+            return False
+        self.Observe(before, after, grid_before - grid_after)
+        return True
+
+    # ---- Persistence ----
+    def Load(self) -> None:
+        if not self.Path:
+            return
+        try:
+            with open(self.Path) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable calibration {self.Path}: {e}")
+            return
+        if stored.get("points") != self.Points:
+            logging.warning("Stored calibration uses other table points, starting from identity")
+            return
+        self.Table = [float(v) for v in stored["table"]]
+        self.Updates = stored.get("updates", 0)
+        logging.info(f"Loaded inverter calibration ({self.Updates} updates)")
+
+    def Save(self) -> None:
+        if not self.Path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.Path) or ".", exist_ok=True)
+            tmp = f"{self.Path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(
+                    {"points": self.Points, "table": [round(v, 1) for v in self.Table], "updates": self.Updates}, f
+                )
+            os.replace(tmp, self.Path)
+        except OSError as e:
+            logging.error(f"Could not save calibration {self.Path}: {e}")
+
+    def GetTable(self) -> List[tuple]:
+        """(commanded, actual) pairs of the current curve."""
+        return [(p, round(v, 1)) for p, v in zip(self.Points, self.Table)]
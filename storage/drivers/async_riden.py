@@ -0,0 +1,371 @@
+import asyncio
+from datetime import datetime
+import time
+import serial_asyncio
+from serial import SerialException
+from modbus_tk.exceptions import ModbusInvalidResponseError
+from .register import Register as R, plan_reads
+from .riden import Riden, UPDATE_REGISTERS, model_for_id
+from .rtu import (
+    EXCEPTION_LENGTH,
+    READ_HOLDING_REGISTERS,
+    WRITE_MULTIPLE_REGISTERS,
+    WRITE_SINGLE_REGISTER,
+    build_request,
+    parse_response,
+    response_length,
+)
+
+# Riden decoders and the registers they consume. Given raw values they never
+# touch the bus, so AsyncRiden fetches asynchronously and reuses them as-is.
+DECODERS = (
+    (Riden.get_id, (R.ID,)),
+    (Riden.get_sn, (R.SN_H, R.SN_L)),
+    (Riden.get_fw, (R.FW,)),
+    (Riden.get_int_c, (R.INT_C_S, R.INT_C)),
+    (Riden.get_int_f, (R.INT_F_S, R.INT_F)),
+    (Riden.get_v_set, (R.V_SET,)),
+    (Riden.get_i_set, (R.I_SET,)),
+    (Riden.get_v_out, (R.V_OUT,)),
+    (Riden.get_i_out, (R.I_OUT,)),
+    (Riden.get_p_out, (R.P_OUT,)),
+    (Riden.get_v_in, (R.V_IN,)),
+    (Riden.is_keypad, (R.KEYPAD,)),
+    (Riden.get_ovp_ocp, (R.OVP_OCP,)),
+    (Riden.get_cv_cc, (R.CV_CC,)),
+    (Riden.is_output, (R.OUTPUT,)),
+    (Riden.get_preset, (R.PRESET,)),
+    (Riden.is_bat_mode, (R.BAT_MODE,)),
+    (Riden.get_v_bat, (R.V_BAT,)),
+    (Riden.get_ext_c, (R.EXT_C_S, R.EXT_C)),
+    (Riden.get_ext_f, (R.EXT_F_S, R.EXT_F)),
+    (Riden.get_ah, (R.AH_H, R.AH_L)),
+    (Riden.get_wh, (R.WH_H, R.WH_L)),
+    (Riden.is_take_ok, (R.OPT_TAKE_OK,)),
+    (Riden.is_take_out, (R.OPT_TAKE_OUT,)),
+    (Riden.is_boot_pow, (R.OPT_BOOT_POW,)),
+    (Riden.is_buzz, (R.OPT_BUZZ,)),
+    (Riden.is_logo, (R.OPT_LOGO,)),
+)
+
+
+class _RtuProtocol(asyncio.Protocol):
+    """Collects bytes from the serial transport for request/response I/O."""
+
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self._waiter = None
+        self._lost = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        self._wake()
+
+    def connection_lost(self, exc):
+        self._lost = exc or SerialException("Serial connection lost")
+        self._wake()
+
+    def _wake(self):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def read_exactly(self, n: int) -> bytes:
+        while len(self.buffer) < n:
+            if self._lost:
+                raise self._lost
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+
+class AsyncRiden:
+    """asyncio counterpart of Riden on a non-blocking serial transport.
+
+    Construction does no I/O; ``await connect()`` (or ``await
+    AsyncRiden.open(...)``) opens the port, detects the model and runs a
+    first update(). Retry and reconnect delays are awaited, never slept, so
+    the driver can share an event loop with the BMS and MQTT code.
+    """
+
+    def __init__(
+        self,
+        port="/dev/ttyUSB0",
+        baudrate=115200,
+        address=1,
+        timeout=0.5,
+        max_gap=0,
+    ):
+        self.port = port
+        self.baudrate = baudrate
+        self.address = address
+        self.timeout = timeout
+        self.max_gap = max_gap
+        self.updated_at = None
+        self.state = None
+        self.transactions = 0  # Modbus requests put on the bus
+        self.id = 0
+        self.type, self.v_multi, self.i_multi, self.p_multi = model_for_id(0)
+        self.v_in_multi = 100
+        self._transport = None
+        self._protocol = None
+        self._bus_lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, *args, **kwargs) -> "AsyncRiden":
+        riden = cls(*args, **kwargs)
+        await riden.connect()
+        return riden
+
+    async def connect(self) -> None:
+        await self._open_serial()
+        await self.init_device()
+        self.type, self.v_multi, self.i_multi, self.p_multi = model_for_id(self.id)
+        self._decoder = self._compile_decoder()
+        await self.update()
+
+    async def _open_serial(self):
+        """Try to (re)open serial connection."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                print(f"🔌 Opening Riden on {self.port} @ {self.baudrate}...")
+                self._transport, self._protocol = await serial_asyncio.create_serial_connection(
+                    loop, _RtuProtocol, self.port, baudrate=self.baudrate
+                )
+                print("✅ Serial connection established.")
+                return
+            except (SerialException, OSError) as e:
+                print(f"⚠️ Riden port open failed ({e}), retrying in 5s...")
+                await asyncio.sleep(5)
+
+    async def close(self) -> None:
+        if self._transport:
+            self._transport.close()
+        self._transport = None
+        self._protocol = None
+
+    async def reconnect(self):
+        """Reopen serial port after error."""
+        await self.close()
+        await self._open_serial()
+        try:
+            await self.init_device()
+        except Exception as e:
+            print(" Re-init failed after reconnect:", e)
+
+    def is_connected(self):
+        return self._transport is not None and not self._transport.is_closing()
+
+    async def execute(self, function_code, starting_address, quantity_of_x=0, output_value=0) -> tuple:
+        """One request/response transaction on the bus."""
+        request = build_request(self.address, function_code, starting_address, quantity_of_x, output_value)
+        expected = response_length(function_code, quantity_of_x)
+        if not self.is_connected():
+            print(" Riden serial not open, reconnecting...")
+            await self.reconnect()
+        async with self._bus_lock:
+            protocol = self._protocol
+            protocol.buffer.clear()  # Drop late answers to timed out requests
+            self.transactions += 1
+            self._transport.write(request)
+            try:
+                response = await asyncio.wait_for(self._read_response(protocol, expected), self.timeout)
+            except asyncio.TimeoutError:
+                raise ModbusInvalidResponseError(f"Response length is invalid {len(protocol.buffer)}")
+        return parse_response(self.address, function_code, response)
+
+    @staticmethod
+    async def _read_response(protocol, expected: int) -> bytes:
+        response = await protocol.read_exactly(EXCEPTION_LENGTH)
+        if not response[1] & 0x80:
+            response += await protocol.read_exactly(expected - EXCEPTION_LENGTH)
+        return response
+
+    async def read(self, register, length=1, retries=3, delay=0.2):
+        for attempt in range(1, retries + 1):
+            try:
+                response = await self.execute(READ_HOLDING_REGISTERS, register, length)
+                return response if length > 1 else response[0]
+            except (SerialException, OSError, ModbusInvalidResponseError) as e:
+                print(f" Read failed ({attempt}/{retries}): {e}")
+                if isinstance(e, (SerialException, OSError)):
+                    await self.reconnect()
+                await asyncio.sleep(delay)
+
+        print(f" Failed to read register {register} after {retries} retries.")
+        return None
+
+    async def write(self, register, value, retries=3, delay=0.2):
+        for attempt in range(1, retries + 1):
+            try:
+                result = await self.execute(WRITE_SINGLE_REGISTER, register, 1, value)
+                self.updated_at = None
+                return result[0]
+            except (SerialException, OSError, ModbusInvalidResponseError) as e:
+                print(f" Write failed ({attempt}/{retries}): {e}")
+                if isinstance(e, (SerialException, OSError)):
+                    await self.reconnect()
+                await asyncio.sleep(delay)
+
+        print(f"Failed to write register {register} after {retries} retries.")
+        return None
+
+    async def write_multiple(self, register: int, values: list[int] | tuple[int, ...], retries=3, delay=0.2):
+        for attempt in range(1, retries + 1):
+            try:
+                result = await self.execute(WRITE_MULTIPLE_REGISTERS, register, len(values), values)
+                self.updated_at = None
+                return result
+            except (SerialException, OSError, ModbusInvalidResponseError) as e:
+                print(f"Write multiple failed ({attempt}/{retries}): {e}")
+                if isinstance(e, (SerialException, OSError)):
+                    await self.reconnect()
+                await asyncio.sleep(delay)
+
+        print("Failed to write multiple registers after retries")
+        return None
+
+    async def read_registers(self, registers, max_gap=None) -> dict:
+        """Read any set of registers in the fewest FC3 requests."""
+        if max_gap is None:
+            max_gap = self.max_gap
+        data = {}
+        for start, length in plan_reads(registers, max_gap):
+            block = await self.read(start, length)
+            if block is None:
+                return None
+            if length == 1:
+                block = (block,)
+            data.update(zip(range(start, start + length), block))
+        return data
+
+    async def init_device(self):
+        try:
+            data = await self.read(R.ID, R.FW - R.ID + 1)
+            if data is None:
+                print("Unable to initialize device — Modbus read failed.")
+                self.id = 0
+                return
+            self.id = data[R.ID]
+            print(f"Riden init successful, ID={self.id}")
+        except Exception as e:
+            print(f"⚠️ Riden init_device() failed: {e}")
+            self.id = 0
+
+    async def update(self) -> None:
+        data = await self.read_registers(UPDATE_REGISTERS)
+        if data is None:
+            print("Riden update failed — Modbus read failed.")
+            return
+        state = self.decode(data)
+        self.updated_at = time.monotonic()
+        self.state = state
+
+    # Bus-free decoding is shared with the blocking driver
+    _compile_decoder = Riden._compile_decoder
+    decode = Riden.decode
+
+    def get_state(self) -> dict:
+        state = self.state
+        return state._asdict() if state else None
+
+    async def get_lang(self) -> int:
+        self.lang = await self.read(R.OPT_LANG)
+        return self.lang
+
+    async def get_light(self) -> int:
+        self.light = await self.read(R.OPT_LIGHT)
+        return self.light
+
+    async def get_date_time(self) -> datetime:
+        if self.type == "RK6006":
+            return
+        d = await self.read(R.YEAR, 6)
+        self.datetime = datetime(d[0], d[1], d[2], d[3], d[4], d[5])
+        return self.datetime
+
+    async def set_date_time(self, d: datetime) -> int:
+        return await self.write_multiple(
+            R.YEAR, (d.year, d.month, d.day, d.hour, d.minute, d.second)
+        )
+
+    async def set_v_set(self, v_set: float) -> float:
+        self.v_set = round(v_set * self.v_multi)
+        return await self.write(R.V_SET, int(self.v_set))
+
+    async def set_i_set(self, i_set: float) -> float:
+        self.i_set = round(i_set * self.i_multi)
+        return await self.write(R.I_SET, int(self.i_set))
+
+    async def set_vi(self, v_set: float, i_set: float) -> tuple:
+        """Set V_SET and I_SET together in one FC16 request."""
+        return await self.write_multiple(
+            R.V_SET, (round(v_set * self.v_multi), round(i_set * self.i_multi))
+        )
+
+    async def set_output(self, output: bool) -> None:
+        self.output = output
+        return await self.write(R.OUTPUT, int(self.output))
+
+    async def set_preset(self, preset: int) -> int:
+        self.preset = preset
+        return await self.write(R.PRESET, self.preset)
+
+    async def set_take_ok(self, take_ok: bool) -> bool:
+        self.take_ok = take_ok
+        return await self.write(R.OPT_TAKE_OK, int(self.take_ok))
+
+    async def set_take_out(self, take_out: bool) -> bool:
+        self.take_out = take_out
+        return await self.write(R.OPT_TAKE_OUT, int(self.take_out))
+
+    async def set_boot_pow(self, boot_pow: bool) -> bool:
+        self.boot_pow = boot_pow
+        return await self.write(R.OPT_BOOT_POW, int(self.boot_pow))
+
+    async def set_buzz(self, buzz: bool) -> bool:
+        self.buzz = buzz
+        return await self.write(R.OPT_BUZZ, int(self.buzz))
+
+    async def set_logo(self, logo: bool) -> bool:
+        self.logo = logo
+        return await self.write(R.OPT_LOGO, int(self.logo))
+
+    async def set_lang(self, lang: int) -> int:
+        self.lang = lang
+        return await self.write(R.OPT_LANG, self.lang)
+
+    async def set_light(self, light: int) -> int:
+        self.light = light
+        return await self.write(R.OPT_LIGHT, self.light)
+
+    async def reboot_bootloader(self) -> None:
+        try:
+            await self.write(R.SYSTEM, R.BOOTLOADER, retries=1)
+        except ModbusInvalidResponseError:
+            pass
+
+
+def _async_getter(decoder, registers):
+    async def getter(self, *raw):
+        if len(raw) < len(registers) or None in raw:
+            raw = await self.read(registers[0], len(registers))
+            if raw is None:
+                return None
+            if len(registers) == 1:
+                raw = (raw,)
+        return decoder(self, *raw)
+
+    getter.__name__ = decoder.__name__
+    getter.__doc__ = f"Awaitable {decoder.__name__}(), reading {len(registers)} register(s) if no raw values are given."
+    return getter
+
+
+for _decoder, _registers in DECODERS:
+    setattr(AsyncRiden, _decoder.__name__, _async_getter(_decoder, _registers))
@@ -0,0 +1,71 @@
+import struct
+from functools import lru_cache
+from .register import Register as R
+from .state import RidenState
+
+# Registers ID..WH_L as they appear in an FC3 response payload
+FRAME = struct.Struct(">%dH" % (R.WH_L + 1))
+
+_OVP_OCP = {1: "OVP", 2: "OCP"}
+_CV_CC = {0: "CV", 1: "CC"}
+
+
+def _signed(sign, value):
+    return f"(-r[{value}] if r[{sign}] else r[{value}])"
+
+
+def _u32(high, low, scale):
+    return f"(r[{high}] << 16 | r[{low}]) / {scale}"
+
+
+@lru_cache(maxsize=None)
+def compile_decoder(v_multi, i_multi, p_multi, v_in_multi=100, i_range_multi=None):
+    """Compile ``decode(r, timestamp) -> RidenState`` for one model's scaling.
+
+    ``r`` is anything indexable by register number: the dict returned by
+    read_registers() or a sequence starting at register 0, such as a FRAME
+    unpacked from raw bytes. ``i_range_multi`` is the (I_RANGE == 0,
+    I_RANGE != 0) current multiplier pair of models that switch range
+    (RD6012P). Decoders are cached, so each model is compiled once.
+    """
+    if i_range_multi:
+        i_scale = f"({i_range_multi[0]} if r[{R.I_RANGE}] == 0 else {i_range_multi[1]})"
+    else:
+        i_scale = str(i_multi)
+    fields = {
+        "int_c": _signed(R.INT_C_S, R.INT_C),
+        "int_f": _signed(R.INT_F_S, R.INT_F),
+        "v_set": f"r[{R.V_SET}] / {v_multi}",
+        "i_set": f"r[{R.I_SET}] / {i_scale}",
+        "v_out": f"r[{R.V_OUT}] / {v_multi}",
+        "i_out": f"r[{R.I_OUT}] / {i_scale}",
+        "p_out": f"r[{R.P_OUT}] / {p_multi}",
+        "v_in": f"r[{R.V_IN}] / {v_in_multi}",
+        "keypad": f"r[{R.KEYPAD}] != 0",
+        "ovp_ocp": f"_OVP_OCP.get(r[{R.OVP_OCP}])",
+        "cv_cc": f"_CV_CC.get(r[{R.CV_CC}])",
+        "output": f"r[{R.OUTPUT}] != 0",
+        "preset": f"r[{R.PRESET}]",
+        "bat_mode": f"r[{R.BAT_MODE}] != 0",
+        "v_bat": f"r[{R.V_BAT}] / {v_multi}",
+        "ext_c": _signed(R.EXT_C_S, R.EXT_C),
+        "ext_f": _signed(R.EXT_F_S, R.EXT_F),
+        "ah": _u32(R.AH_H, R.AH_L, 1000),
+        "wh": _u32(R.WH_H, R.WH_L, 1000),
+    }
+    assert tuple(fields) == RidenState._fields[1:]
+    source = "def decode(r, timestamp):\n    return _new(_State, (timestamp, %s))\n" % ", ".join(fields.values())
+    namespace = {"_new": tuple.__new__, "_State": RidenState, "_OVP_OCP": _OVP_OCP, "_CV_CC": _CV_CC}
+    exec(compile(source, "<riden decoder>", "exec"), namespace)
+    return namespace["decode"]
+
+
+def decode_frames(decode, frames, timestamps) -> list:
+    """Decode historical raw frames with a compiled decoder.
+
+    ``frames`` is either a bytes-like buffer of back-to-back FRAME records or
+    an iterable of register sequences starting at register 0.
+    """
+    if isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = FRAME.iter_unpack(frames)
+    return [decode(r, timestamp) for r, timestamp in zip(frames, timestamps)]
@@ -0,0 +1,212 @@
+import socketserver
+import struct
+import threading
+import time
+from modbus_tk.exceptions import ModbusError
+from .register import MAX_READ, Register as R
+from .riden import SHADOW_REGISTERS, RidenUnavailable
+from .rtu import MAX_WRITE, READ_HOLDING_REGISTERS, WRITE_MULTIPLE_REGISTERS, WRITE_SINGLE_REGISTER
+from .scheduler import TELEMETRY
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+SLAVE_DEVICE_FAILURE = 4
+GATEWAY_TARGET_FAILED = 11  # No response from the device behind the gateway
+
+# Registers clients may write: setpoints, output, options, presets and the
+# clock. Calibration and SYSTEM (bootloader) stay out of reach.
+WRITABLE_REGISTERS = frozenset(
+    SHADOW_REGISTERS + tuple(range(R.YEAR, R.SECOND + 1)) + tuple(range(R.M0_V, R.M9_OCP + 1))
+)
+
+# MBAP header: transaction id, protocol id, length, unit id
+MBAP = struct.Struct(">HHHB")
+
+
+class _Flight:
+    """One in-progress bus read that concurrent identical requests wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.values = None
+        self.error = None
+
+
+class RidenGateway:
+    """Modbus TCP server multiplexing one Riden among many clients.
+
+    The gateway owns the Riden (and so the serial port) and answers FC3,
+    FC6 and FC16 from any number of TCP clients. Identical reads in flight
+    at the same time share one RTU transaction, and reads younger than
+    ``ttl`` seconds are answered from cache. A write bumps a generation
+    counter: cached blocks overlapping it are dropped, and reads that were
+    in flight when it happened are neither cached nor joined by later
+    requests, so a client never reads back data older than its own write.
+
+    Clients are not authenticated, so writes outside ``writable`` are
+    refused with ILLEGAL_DATA_ADDRESS and the server binds to localhost
+    unless told otherwise.
+    """
+
+    def __init__(self, riden, ttl: float = 0.2, writable=WRITABLE_REGISTERS):
+        self.riden = riden
+        self.ttl = ttl
+        self.writable = frozenset(writable)
+        self._lock = threading.Lock()
+        self._cache = {}  # (start, count) -> (time.monotonic(), values)
+        self._flights = {}  # (start, count, generation) -> _Flight
+        self._generation = 0
+        self.counters = dict.fromkeys(("requests", "cache_hits", "coalesced", "bus_reads", "writes", "errors"), 0)
+
+    # ---- Reads ----
+    def read(self, start: int, count: int) -> tuple:
+        """Registers start..start+count-1, from cache, a shared flight or the bus."""
+        key = (start, count)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self.counters["cache_hits"] += 1
+                return cached[1]
+            generation = self._generation
+            flight = self._flights.get(key + (generation,))
+            leader = flight is None
+            if leader:
+                flight = self._flights[key + (generation,)] = _Flight()
+            else:
+                self.counters["coalesced"] += 1
+        if leader:
+            try:
+                flight.values = self._bus_read(start, count)
+            except Exception as e:
+                flight.error = e
+            with self._lock:
+                del self._flights[key + (generation,)]
+                if flight.values is not None and generation == self._generation:
+                    self._cache[key] = (time.monotonic(), flight.values)
+            flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error:
+            raise flight.error
+        return flight.values
+
+    def _bus_read(self, start: int, count: int):
+        self.counters["bus_reads"] += 1
+        values = self.riden.read(start, count, priority=TELEMETRY)
+        if values is None:
+            return None
+        return (values,) if count == 1 else tuple(values)
+
+    # ---- Writes ----
+    def write(self, start: int, values) -> bool:
+        """Write registers through the Riden and invalidate overlapping reads."""
+        self.counters["writes"] += 1
+        self._invalidate(start, len(values))
+        if len(values) == 1:
+            result = self.riden.write(start, values[0])
+        else:
+            result = self.riden.write_multiple(start, values)
+        # Again, in case a read completed while the write was on the bus
+        self._invalidate(start, len(values))
+        return result is not None
+
+    def _invalidate(self, start: int, count: int) -> None:
+        end = start + count
+        with self._lock:
+            self._generation += 1
+            for block_start, block_count in list(self._cache):
+                if block_start < end and start < block_start + block_count:
+                    del self._cache[(block_start, block_count)]
+
+    # ---- Protocol ----
+    def handle_pdu(self, pdu: bytes) -> bytes:
+        """Answer one Modbus PDU (function code + data) with a response PDU."""
+        self.counters["requests"] += 1
+        function_code = pdu[0] if pdu else 0
+        try:
+            if function_code == READ_HOLDING_REGISTERS and len(pdu) == 5:
+                start, count = struct.unpack_from(">HH", pdu, 1)
+                if not 1 <= count <= MAX_READ:
+                    return self._exception(function_code, ILLEGAL_DATA_VALUE)
+                values = self.read(start, count)
+                if values is None:
+                    return self._exception(function_code, GATEWAY_TARGET_FAILED)
+                return struct.pack(">BB%dH" % count, function_code, 2 * count, *values)
+            if function_code == WRITE_SINGLE_REGISTER and len(pdu) == 5:
+                register, value = struct.unpack_from(">HH", pdu, 1)
+                if register not in self.writable:
+                    return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+                if not self.write(register, (value,)):
+                    return self._exception(function_code, GATEWAY_TARGET_FAILED)
+                return pdu
+            if function_code == WRITE_MULTIPLE_REGISTERS and len(pdu) >= 6:
+                start, count, size = struct.unpack_from(">HHB", pdu, 1)
+                if not 1 <= count <= MAX_WRITE or size != 2 * count or len(pdu) != 6 + size:
+                    return self._exception(function_code, ILLEGAL_DATA_VALUE)
+                if not self.writable.issuperset(range(start, start + count)):
+                    return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+                if not self.write(start, struct.unpack_from(">%dH" % count, pdu, 6)):
+                    return self._exception(function_code, GATEWAY_TARGET_FAILED)
+                return pdu[:5]
+            if function_code in (READ_HOLDING_REGISTERS, WRITE_SINGLE_REGISTER, WRITE_MULTIPLE_REGISTERS):
+                return self._exception(function_code, ILLEGAL_DATA_VALUE)
+            return self._exception(function_code, ILLEGAL_FUNCTION)
+        except ModbusError as e:  # Exception response from the Riden, passed on
+            return self._exception(function_code, e.get_exception_code())
+        except RidenUnavailable:
+            return self._exception(function_code, GATEWAY_TARGET_FAILED)
+        except Exception as e:
+            print(f" Gateway request failed: {e}")
+            return self._exception(function_code, SLAVE_DEVICE_FAILURE)
+
+    def _exception(self, function_code: int, code: int) -> bytes:
+        self.counters["errors"] += 1
+        return bytes([function_code | 0x80, code])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, cached_blocks=len(self._cache))
+
+    # ---- TCP server ----
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 5020) -> None:
+        with self.server(host, port) as server:
+            print(f"Riden Modbus TCP gateway listening on {host}:{port}")
+            server.serve_forever()
+
+    def server(self, host: str = "127.0.0.1", port: int = 5020):
+        """ThreadingTCPServer bound to host:port, one thread per client."""
+        gateway = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock = self.request
+                try:
+                    while True:
+                        header = _recv_exact(sock, MBAP.size)
+                        if header is None:
+                            return
+                        transaction, protocol, length, unit = MBAP.unpack(header)
+                        pdu = _recv_exact(sock, length - 1)
+                        if pdu is None or protocol != 0:
+                            return
+                        response = gateway.handle_pdu(pdu)
+                        sock.sendall(MBAP.pack(transaction, 0, len(response) + 1, unit) + response)
+                except OSError:
+                    return
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+
+def _recv_exact(sock, size: int):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
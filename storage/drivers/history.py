@@ -0,0 +1,67 @@
+from array import array
+from bisect import bisect_left
+
+# Column name -> array typecode
+FIELDS = {
+    "timestamp": "d",
+    "v_out": "d",
+    "i_out": "d",
+    "p_out": "d",
+    "v_in": "d",
+    "v_bat": "d",
+    "cv_cc": "b",  # -1 unknown, 0 CV, 1 CC
+    "output": "b",
+    "ah": "d",
+    "wh": "d",
+    "int_c": "h",
+    "ext_c": "h",
+}
+_CV_CC = {"CV": 0, "CC": 1}
+
+
+class RidenHistory:
+    """Fixed-memory ring buffer of the last ``capacity`` RidenState samples.
+
+    Each field is an ``array`` column allocated once at twice the capacity;
+    every sample is written to both halves, so the newest ``n`` samples are
+    always contiguous and window() can hand out memoryviews without copying.
+    Views stay valid but are overwritten as the ring advances.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        self.capacity = capacity
+        self.columns = {name: array(code, [0]) * (2 * capacity) for name, code in FIELDS.items()}
+        self.count = 0  # Samples appended since creation
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, state) -> None:
+        values = (
+            state.timestamp, state.v_out, state.i_out, state.p_out, state.v_in,
+            state.v_bat, _CV_CC.get(state.cv_cc, -1), state.output, state.ah,
+            state.wh, state.int_c, state.ext_c,
+        )
+        low = self.count % self.capacity
+        high = low + self.capacity
+        for column, value in zip(self.columns.values(), values):
+            column[low] = column[high] = value
+        self.count += 1
+
+    def window(self, field: str, n: int = None) -> memoryview:
+        """Zero-copy view of the last n samples of field, oldest first."""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = (self.count - 1) % self.capacity + self.capacity + 1 if self.count else 0
+        return memoryview(self.columns[field])[end - n:end]
+
+    def count_since(self, timestamp: float) -> int:
+        """Number of retained samples taken at or after timestamp."""
+        times = self.window("timestamp")
+        return len(times) - bisect_left(times, timestamp)
+
+    def since(self, field: str, timestamp: float) -> memoryview:
+        """Zero-copy view of field for samples taken at or after timestamp."""
+        return self.window(field, self.count_since(timestamp))
@@ -0,0 +1,145 @@
+from bisect import bisect_left
+from collections import deque
+from modbus_tk.exceptions import ModbusInvalidResponseError
+
+
+class RttEstimator:
+    """Rolling round-trip time statistics per transaction kind.
+
+    Keys are ``(function_code, length)`` tuples. The response timeout is a
+    percentile of the recent round-trips times a safety margin, and the
+    retry delay backs off from the median; both stay within floor/ceiling.
+    Until ``min_samples`` round-trips are known the timeout is the ceiling
+    and the retry delay the fixed ``cold_delay``, so a cold or rarely used
+    key retries no slower than before.
+    """
+
+    def __init__(
+        self, floor=0.03, ceiling=0.5, window=50, percentile=0.95, margin=2.0, min_samples=10, cold_delay=0.2
+    ):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.cold_delay = cold_delay
+        self.window = window
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self._samples = {}
+
+    def record(self, key, rtt: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(rtt)
+
+    def quantile(self, key, q: float):
+        samples = self._samples.get(key)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _clamp(self, value: float) -> float:
+        return max(self.floor, min(self.ceiling, value))
+
+    def timeout(self, key) -> float:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return self.ceiling
+        return self._clamp(self.quantile(key, self.percentile) * self.margin)
+
+    def retry_delay(self, key, attempt: int = 1) -> float:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return self.cold_delay
+        return self._clamp(self.quantile(key, 0.5) * 2 ** (attempt - 1))
+
+    def stats(self) -> dict:
+        """Per-key sample count, median/percentile RTT and derived timeout."""
+        return {
+            key: {
+                "count": len(samples),
+                "p50": self.quantile(key, 0.5),
+                "p%d" % round(self.percentile * 100): self.quantile(key, self.percentile),
+                "timeout": self.timeout(key),
+                "retry_delay": self.retry_delay(key),
+            }
+            for key, samples in self._samples.items()
+        }
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (seconds)."""
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency: float) -> None:
+        self.buckets[bisect_left(self.BOUNDS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+
+    def snapshot(self) -> dict:
+        labels = [f"<={bound}" for bound in self.BOUNDS] + [f">{self.BOUNDS[-1]}"]
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "buckets": {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+class BusStats:
+    """Per-operation latency histograms and error counters for a driver.
+
+    Operations are keyed like ``"read:10x3"``, ``"write:9"`` or
+    ``"reconnect"``. ``hook(operation, latency, ok)`` is called after every
+    recorded operation when set; exceptions raised by the hook are ignored.
+    """
+
+    COUNTERS = ("retries", "timeouts", "crc_errors", "invalid_responses", "serial_errors", "skipped_writes", "outages")
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.operations = {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def record(self, operation: str, latency: float, ok: bool = True) -> None:
+        histogram = self.operations.get(operation)
+        if histogram is None:
+            histogram = self.operations[operation] = LatencyHistogram()
+        histogram.record(latency)
+        if self.hook:
+            try:
+                self.hook(operation, latency, ok)
+            except Exception as e:
+                print(f" Stats hook failed: {e}")
+
+    def count(self, counter: str, n: int = 1) -> None:
+        self.counters[counter] += n
+
+    def count_error(self, error: Exception) -> None:
+        """Classify a failed transaction into the error counters."""
+        message = str(error)
+        if not isinstance(error, ModbusInvalidResponseError):
+            self.count("serial_errors")
+        elif "CRC" in message:
+            self.count("crc_errors")
+        elif message.endswith("invalid 0"):  # Nothing arrived before the timeout
+            self.count("timeouts")
+        else:
+            self.count("invalid_responses")
+
+    def snapshot(self) -> dict:
+        return {
+            "operations": {name: h.snapshot() for name, h in sorted(self.operations.items())},
+            "counters": dict(self.counters),
+        }
@@ -0,0 +1,38 @@
+import json
+import os
+
+# Per-port facts worth remembering across restarts (baud rate, link quality)
+DEFAULT_PATH = os.path.expanduser("~/.cache/riden/ports.json")
+
+
+def load_port_config(port: str, path: str = DEFAULT_PATH) -> dict:
+    """Stored settings for port, or an empty dict."""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f).get(port, {})
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️ Ignoring unreadable port config {path}: {e}")
+        return {}
+
+
+def save_port_config(port: str, path: str = DEFAULT_PATH, **values) -> None:
+    """Merge values into the stored settings for port (atomic replace)."""
+    if not path:
+        return
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    config.setdefault(port, {}).update(values)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(config, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ Could not save port config {path}: {e}")
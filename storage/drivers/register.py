@@ -108,3 +108,26 @@ class Register:
     SYSTEM = 256
     # NOT REGISTERS - Magic numbers for the registers
     BOOTLOADER = 5633
+
+
+# Largest register count a single Modbus FC3 request may ask for
+MAX_READ = 125
+
+
+def plan_reads(registers, max_gap=0, max_length=MAX_READ):
+    """Coalesce registers into the fewest contiguous FC3 blocks.
+
+    Registers separated by at most ``max_gap`` unrequested registers share a
+    block, so the gap is read and discarded instead of costing another
+    round-trip. Returns a list of ``(start, length)`` tuples.
+    """
+    blocks = []
+    for register in sorted(set(registers)):
+        if blocks:
+            start, length = blocks[-1]
+            end = start + length
+            if register - end <= max_gap and register - start < max_length:
+                blocks[-1] = (start, register - start + 1)
+                continue
+        blocks.append((register, 1))
+    return blocks
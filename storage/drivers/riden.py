@@ -1,310 +1,828 @@
 from serial import Serial, SerialException
 from modbus_tk.modbus_rtu import RtuMaster
 from modbus_tk.exceptions import ModbusInvalidResponseError
+import random
+import threading
 import time
 from datetime import datetime
-from .register import Register as R
+from .history import RidenHistory
+from .metrics import BusStats, RttEstimator
+from .decoder import compile_decoder
+from .port_config import DEFAULT_PATH, load_port_config, save_port_config
+from .register import Register as R, plan_reads
+from .rtu import MAX_WRITE, WRITE_MULTIPLE_REGISTERS, RtuTransport
+from .scheduler import BusScheduler, CONFIG, CONTROL, SAFETY, TELEMETRY
+from .state import RidenState
+
+# Registers decoded by update()
+UPDATE_REGISTERS = tuple(range(R.INT_C_S, R.I_RANGE + 1)) + tuple(
+    range(R.BAT_MODE, R.WH_L + 1)
+)
+# Options and memory presets covered by export_config()/import_config()
+CONFIG_REGISTERS = tuple(range(R.OPT_TAKE_OK, R.OPT_LIGHT + 1)) + tuple(
+    range(R.M0_V, R.M9_OCP + 1)
+)
+_CONFIG_NAMES = {
+    value: name for name, value in vars(R).items() if name.isupper() and value in CONFIG_REGISTERS
+}
+# Identification registers read along with the first snapshot
+IDENT_REGISTERS = (R.ID, R.SN_H, R.SN_L, R.FW)
+# BusStats operation names per function code, formatted with (register, quantity)
+_OPERATIONS = {3: "read:{0}x{1}", 6: "write:{0}", 16: "write_multiple:{0}x{1}"}
+# RidenState fields mirrored onto Riden attributes
+STATE_FIELDS = RidenState._fields[1:]
+# Holding registers whose writes are skipped when the shadow already matches
+SHADOW_REGISTERS = (R.V_SET, R.I_SET, R.OUTPUT, R.PRESET) + tuple(
+    range(R.OPT_TAKE_OK, R.OPT_LIGHT + 1)
+)
+# Rates selectable in the RD60xx menu, tried by calibrate_baudrate()
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200)
+DEFAULT_BAUDRATE = 115200
+
+
+def model_for_id(_id: int) -> tuple:
+    """Map a device ID to (type, v_multi, i_multi, p_multi)."""
+    if 60241 <= _id:
+        return "RD6024", 100, 100, 100
+    if 60180 <= _id <= 60189:
+        return "RD6018", 100, 100, 100
+    if 60120 <= _id <= 60124:
+        return "RD6012", 100, 100, 100
+    if 60125 <= _id <= 60129:
+        # i_multi is not constant, update() switches it on I_RANGE
+        return "RD6012P", 1000, 100, 1000
+    if 60060 <= _id <= 60064:
+        return "RD6006", 100, 1000, 100
+    if _id == 60065:
+        return "RD6006P", 1000, 10000, 1000
+    if _id == 60066:
+        return "RK6006", 100, 1000, 100
+    return None, 100, 100, 100
+
+
+class RidenUnavailable(Exception):
+    """The link to the Riden is down; it is being reconnected in the background."""
+
 
 class Riden:
     def __init__(
         self,
         port="/dev/ttyUSB0",
-        baudrate=115200,
+        baudrate=None,
         address=1,
         serial=None,
         master=None,
         close_after_call=False,
         timeout=0.5,
+        max_gap=0,
+        cache=False,
+        max_age=0.5,
+        field_max_age=None,
+        adaptive=True,
+        timeout_floor=0.03,
+        history_size=0,
+        stats_hook=None,
+        connect="blocking",
+        port_config=DEFAULT_PATH,
+        transport="modbus_tk",
+        reconnect_min=0.5,
+        reconnect_max=30.0,
+        failure_threshold=3,
+        status_hook=None,
     ):
         self.port = port
         self.baudrate = baudrate
         self.address = address
         self.timeout = timeout
+        self.max_gap = max_gap
+        self.cache = cache
+        self.max_age = max_age
+        self.field_max_age = dict(field_max_age or {})
+        self.updated_at = None  # time.monotonic() of the last update()
+        self.state = None  # Latest RidenState, replaced atomically
+        # Last history_size update() samples, None when disabled
+        self.history = RidenHistory(history_size) if history_size else None
+        self.bus = BusScheduler()
+        self._shadow = {}  # register -> last raw value confirmed on the device
+        self._shadow_writes = 0
+        self._poller = None
+        self._poller_stop = threading.Event()
+        self.transactions = 0  # Modbus requests put on the bus
+        self.metrics = BusStats(stats_hook)
+        # Response timeout and retry delay follow measured round-trips,
+        # bounded by timeout_floor and the configured timeout
+        self.adaptive = adaptive
+        self.rtt = RttEstimator(floor=timeout_floor, ceiling=timeout)
+        self._applied_timeout = None
         self.id = 0
         self.serial = None
         self.master = None
-
-        self._open_serial()   # 🔹 Use helper instead of direct init
-        self.init_device()
-        self.v_multi = 100
-        self.i_multi = 100
-        self.p_multi = 100
+        # "idle" until connect() starts, "connecting", then "ready";
+        # "unavailable" while the link is down and reconnecting
+        self.status = "idle"
+        self.status_since = time.monotonic()
+        self.status_hook = status_hook  # status_hook(old, new) on every transition
+        self._connector = None  # Thread allowed on the bus while (re)connecting
+        self._connect_lock = threading.Lock()
+        self._health_lock = threading.Lock()
+        # Circuit breaker: trips on serial errors or failure_threshold
+        # consecutive unanswered requests, then reconnects with exponential
+        # backoff between reconnect_min and reconnect_max seconds
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.failure_threshold = failure_threshold
+        self._failures = 0
+        self.next_attempt = None  # time.monotonic() of the next reconnect attempt
+        self.port_config = port_config
+        if transport not in ("modbus_tk", "lean"):
+            raise ValueError(f"Unknown transport {transport!r}")
+        self.transport = transport
+
+        # Start from the baud rate last found by calibrate_baudrate() on this port
+        if baudrate is None:
+            self.baudrate = load_port_config(port, port_config).get("baudrate", DEFAULT_BAUDRATE)
+        self.sn = None
+        self.type, self.v_multi, self.i_multi, self.p_multi = model_for_id(self.id)
         self.v_in_multi = 100
-
-        if 60241 <= self.id:
-            self.type = "RD6024"
-        elif 60180 <= self.id <= 60189:
-            self.type = "RD6018"
-        elif 60120 <= self.id <= 60124:
-            self.type = "RD6012"
-        elif 60125 <= self.id <= 60129:
-            self.type = "RD6012P"
-            self.v_multi = 1000
-            self.p_multi = 1000
-            # i_multi is not constant!
-        elif 60060 <= self.id <= 60064:
-            self.type = "RD6006"
-            self.i_multi = 1000
-        elif self.id == 60065:
-            self.type = "RD6006P"
-            self.v_multi = 1000
-            self.i_multi = 10000
-            self.p_multi = 1000
-        elif self.id == 60066:
-            self.type = "RK6006"
-            self.v_multi = 100
-            self.i_multi = 1000
-            self.p_multi = 100
-
-        self.update()
+        self._decoder = self._compile_decoder()
+
+        # "lazy" connects in the background on first use
+        if connect == "blocking":
+            self.connect()
+        elif connect == "background":
+            self.start_connect()
+        elif connect != "lazy":
+            raise ValueError(f"Unknown connect mode {connect!r}")
+
+    def start_connect(self) -> None:
+        """Run connect() in a background thread unless it already started."""
+        with self._health_lock:
+            if self.status != "idle":
+                return
+            self._set_status("connecting")
+        threading.Thread(target=self.connect, daemon=True).start()
+
+    def connect(self) -> None:
+        """Open the port, identify the device and publish the first state.
+
+        Identification rides along with the first snapshot: registers ID..FW
+        are read in the same block as the info registers, so any start costs
+        exactly one update() worth of reads.
+        """
+        with self._connect_lock:
+            if self.status == "ready":
+                return
+            self._set_status("connecting")
+            self._connector = threading.get_ident()
+            try:
+                self._open_serial()
+                while True:
+                    writes = self._shadow_writes
+                    data = self.read_registers(UPDATE_REGISTERS + IDENT_REGISTERS)
+                    if data is not None:
+                        break
+                    print("⚠️ Riden did not answer identification, retrying in 5s...")
+                    time.sleep(5)
+                self._identify(data)
+                self._publish(data, writes)
+                self._set_status("ready")
+                print(f"Riden {self.type} ready, ID={self.id}, SN={self.sn}")
+            finally:
+                self._connector = None
+
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def health(self) -> dict:
+        """Link status, seconds spent in it and the breaker's failure count."""
+        next_attempt = self.next_attempt if self.status == "unavailable" else None
+        return {
+            "status": self.status,
+            "seconds": time.monotonic() - self.status_since,
+            "failures": self._failures,
+            "next_attempt_in": max(0.0, next_attempt - time.monotonic()) if next_attempt else None,
+        }
+
+    def _set_status(self, status: str) -> None:
+        old = self.status
+        if old == status:
+            return
+        self.status = status
+        self.status_since = time.monotonic()
+        if self.status_hook:
+            try:
+                self.status_hook(old, status)
+            except Exception as e:
+                print(f" Status hook failed: {e}")
+
+    def _identify(self, data) -> None:
+        _id = data[R.ID]
+        self.sn = "%08d" % (data[R.SN_H] << 16 | data[R.SN_L])
+        self.fw = data[R.FW]
+        if _id == self.id:
+            return  # Same model as before a reconnect, decoder still valid
+        self.id = _id
+        self.type, self.v_multi, self.i_multi, self.p_multi = model_for_id(_id)
+        self._decoder = self._compile_decoder()
     # --- NEW: safe serial open helper ---
     def _open_serial(self):
         """Try to (re)open serial connection."""
         while True:
             try:
-                print(f"🔌 Opening Riden on {self.port} @ {self.baudrate}...")
-                self.serial = Serial(self.port, self.baudrate, timeout=self.timeout)
-                self.master = RtuMaster(self.serial)
-                self.master.set_timeout(self.timeout)
-                print("✅ Serial connection established.")
+                self._open_port()
                 return
             except SerialException as e:
                 print(f"⚠️ Riden port open failed ({e}), retrying in 5s...")
                 time.sleep(5)
 
-    def reconnect(self):
-        """Reopen serial port after error."""
+    def _open_port(self) -> None:
+        """Open the serial port once; raises SerialException on failure."""
+        print(f"🔌 Opening Riden on {self.port} @ {self.baudrate}...")
+        self._close_serial()
+        self.serial = Serial(self.port, self.baudrate, timeout=self.timeout)
+        if self.transport == "lean":
+            self.master = RtuTransport(self.serial)
+        else:
+            self.master = RtuMaster(self.serial)
+        self.master.set_timeout(self.timeout)
+        self._applied_timeout = self.timeout
+        print("✅ Serial connection established.")
+
+    def _close_serial(self) -> None:
         try:
             if self.serial:
                 self.serial.close()
         except Exception:
             pass
-        self._open_serial()
-        try:
-            self.init_device()
-        except Exception as e:
-            print(" Re-init failed after reconnect:", e)
+
+    def reconnect(self):
+        """Drop the link and reconnect in the background; returns immediately."""
+        self._link_down("reconnect requested")
+
+    def _link_down(self, reason) -> None:
+        """Trip the breaker: callers get RidenUnavailable until _recover() succeeds."""
+        with self._health_lock:
+            if self.status == "unavailable":
+                return
+            self._set_status("unavailable")
+        self.metrics.count("outages")
+        print(f"⚠️ Riden unavailable ({reason}), reconnecting in the background...")
+        threading.Thread(target=self._recover, daemon=True).start()
+
+    def _recover(self) -> None:
+        """Reconnect loop with exponential backoff and full jitter.
+
+        Each attempt reopens the port and re-reads the identification and
+        info registers, so the unit is re-identified (it may have been
+        swapped or power cycled) and a fresh state is published on success.
+        """
+        backoff = self.reconnect_min
+        outage = time.monotonic()
+        while True:
+            self.next_attempt = time.monotonic() + random.uniform(0, backoff)
+            time.sleep(max(0.0, self.next_attempt - time.monotonic()))
+            self._connector = threading.get_ident()
+            try:
+                with self.bus.slot(CONTROL):
+                    self._close_serial()
+                    self._shadow.clear()  # The device may have been power cycled
+                    self._open_port()
+                writes = self._shadow_writes
+                data = self.read_registers(UPDATE_REGISTERS + IDENT_REGISTERS)
+            except (SerialException, OSError) as e:
+                print(f"⚠️ Riden port open failed ({e})")
+                data = None
+            finally:
+                self._connector = None
+            if data is not None:
+                break
+            backoff = min(2 * backoff, self.reconnect_max)
+            print(f"⚠️ Riden still unavailable, next attempt within {backoff:.1f}s")
+        self._identify(data)
+        self._publish(data, writes)
+        self._failures = 0
+        self.next_attempt = None
+        self.metrics.record("reconnect", time.monotonic() - outage)
+        self._set_status("ready")
+        print(f"Riden {self.type} reconnected, ID={self.id}, SN={self.sn}")
+
+    def calibrate_baudrate(self, rates=BAUD_RATES, requests=50, retries=3, apply=True) -> dict:
+        """Benchmark the link at each candidate rate and pick the best one.
+
+        Each rate gets ``requests`` reads of the info block with up to
+        ``retries`` attempts each. The score is good responses per second
+        over the whole run, so timeouts, CRC failures and the retries they
+        cost all count against it. A rate that fails its first request is
+        skipped.
+
+        The RD60xx rate is set in the unit's menu, not over Modbus, so only
+        the rate the unit is set to will answer. Results are merged into the
+        port config, so runs after changing the rate on the panel (e.g. for
+        a longer cable) are compared too. ``recommended`` is the best rate
+        seen on any run. With ``apply`` the best rate that answers now is
+        used from then on and stored for the next start. The bus is held
+        for the whole run. The instance must be ready, or idle when created
+        with connect="lazy" to find the rate of an unknown unit.
+        """
+        if requests < 1 or retries < 1:
+            raise ValueError("calibrate_baudrate needs at least one request and one try per request")
+        if self.status not in ("idle", "ready"):
+            raise RidenUnavailable(f"Riden on {self.port} is {self.status}, cannot calibrate")
+        stored = load_port_config(self.port, self.port_config).get("link_quality", {})
+        results = {}
+        original = self.baudrate
+        with self.bus.slot(CONTROL):
+            for rate in rates:
+                self._close_serial()
+                self.baudrate = rate
+                try:
+                    self._open_port()
+                except SerialException as e:
+                    print(f"⚠️ Cannot open {self.port} at {rate} baud: {e}")
+                    continue
+                results[rate] = result = self._benchmark_link(requests, retries)
+                print(
+                    f"Riden @ {rate}: {result['tx_per_s']:.1f} tx/s, "
+                    f"{result['ok']}/{result['requests']} ok, {result['retries']} retries"
+                )
+            # Silent rates keep the figures measured when the unit was set to them
+            answered = {rate: r["tx_per_s"] for rate, r in results.items() if r["ok"]}
+            quality = {**stored, **{str(rate): tx for rate, tx in answered.items()}}
+            best = max(answered, key=answered.get, default=None)
+            recommended = max(quality, key=quality.get, default=None)
+            recommended = int(recommended) if recommended else None
+            self.baudrate = best if apply and best else original
+            self._close_serial()
+            try:
+                self._open_port()
+            except SerialException as e:
+                print(f"⚠️ Riden port reopen failed ({e})")
+            self.rtt = RttEstimator(floor=self.rtt.floor, ceiling=self.rtt.ceiling)  # Old RTTs no longer apply
+        values = {"link_quality": quality}
+        if apply and best:
+            values["baudrate"] = best
+        save_port_config(self.port, self.port_config, **values)
+        if recommended and recommended != best:
+            print(f"Riden link was best at {recommended} baud; select it in the unit's menu and re-run.")
+        return {"rates": results, "best": best, "recommended": recommended, "baudrate": self.baudrate}
+
+    def _benchmark_link(self, requests, retries) -> dict:
+        """Time ``requests`` info-block reads on the open port (bus held)."""
+        errors = BusStats()
+        ok = attempts = sent = 0
+        self.master.set_timeout(self.timeout)
+        start = time.monotonic()
+        for n in range(requests):
+            sent += 1
+            for attempt in range(retries):
+                attempts += 1
+                self.transactions += 1
+                try:
+                    self.serial.reset_input_buffer()
+                    self.master.execute(self.address, 3, R.INT_C_S, R.I_RANGE - R.INT_C_S + 1, threadsafe=False)
+                    ok += 1
+                    break
+                except (SerialException, OSError, ModbusInvalidResponseError) as e:
+                    errors.count_error(e)
+            if n == 0 and not ok:
+                break  # Nothing answers at this rate
+        elapsed = time.monotonic() - start
+        return {
+            "requests": sent,
+            "ok": ok,
+            "retries": attempts - sent,
+            "tx_per_s": ok / elapsed,
+            **{
+                name: errors.counters[name]
+                for name in ("timeouts", "crc_errors", "invalid_responses", "serial_errors")
+            },
+        }
 
     def is_connected(self):
         return self.serial and self.serial.is_open
     
-    def read(self, register, length=1, retries=3, delay=0.2):
+    def _apply_timeout(self, key) -> None:
+        timeout = self.rtt.timeout(key) if self.adaptive else self.timeout
+        if timeout != self._applied_timeout:
+            self.master.set_timeout(timeout)
+            self._applied_timeout = timeout
+
+    def _transact(
+        self, function_code, register, quantity, value=0, retries=3, delay=None, label="Read", priority=TELEMETRY
+    ):
+        """Run one Modbus request with retries; None once retries are exhausted.
+
+        With ``delay=None`` the retry delay comes from the RTT estimator
+        (adaptive mode) or defaults to 0.2 s. Each attempt queues for the bus
+        separately at ``priority``, so urgent writes can overtake retries.
+
+        Raises RidenUnavailable without touching the bus while the link is
+        down, and trips the breaker on serial errors or after
+        failure_threshold consecutive requests went unanswered.
+        """
+        connector = threading.get_ident() == self._connector
+        if self.status != "ready" and not connector:
+            if self.status == "unavailable":
+                raise RidenUnavailable(f"Riden on {self.port} is unavailable, reconnecting")
+            if self.status == "idle":
+                self.start_connect()
+                raise RidenUnavailable(f"Riden on {self.port} is connecting")
+            print(f" Riden still connecting, {label.lower()} of register {register} dropped.")
+            return None
+        key = (function_code, quantity)
+        operation = _OPERATIONS[function_code].format(register, quantity)
         for attempt in range(1, retries + 1):
+            if attempt > 1:
+                self.metrics.count("retries")
+            start = None
             try:
-                if not self.is_connected():
-                    print(" Riden serial not open, reconnecting...")
-                    self.reconnect()
-
-                if self.serial:
-                    self.serial.reset_input_buffer()
-                    self.serial.reset_output_buffer()
-
-                response = self.master.execute(self.address, 3, register, length)
-                return response if length > 1 else response[0]
+                with self.bus.slot(priority):
+                    if not self.is_connected():
+                        if not connector:
+                            self._link_down("serial port not open")
+                            raise RidenUnavailable(f"Riden on {self.port} is unavailable, reconnecting")
+                        self._open_port()
+
+                    if self.serial:
+                        self.serial.reset_input_buffer()
+                        self.serial.reset_output_buffer()
+
+                    self._apply_timeout(key)
+                    self.transactions += 1
+                    start = time.monotonic()
+                    # The bus slot already serialises this port; modbus_tk's own
+                    # lock is process-wide and would serialise all ports
+                    response = self.master.execute(
+                        self.address, function_code, register, quantity, value, threadsafe=False
+                    )
+                    latency = time.monotonic() - start
+                    self.rtt.record(key, latency)
+                self.metrics.record(operation, latency)
+                self._failures = 0
+                return response
 
             except (SerialException, OSError, ModbusInvalidResponseError) as e:
-                print(f" Read failed ({attempt}/{retries}): {e}")
+                if start is not None:
+                    self.metrics.record(operation, time.monotonic() - start, ok=False)
+                self.metrics.count_error(e)
+                print(f" {label} failed ({attempt}/{retries}): {e}")
                 if isinstance(e, (SerialException, OSError)):
-                    self.reconnect()
-                time.sleep(delay)
-
-        print(f" Failed to read register {register} after {retries} retries.")
-        return None           
-
-    def write(self, register, value, retries=3, delay=0.2):
-        for attempt in range(1, retries + 1):
-            try:
-                if not self.is_connected():
-                    print(" Riden serial not open, reconnecting...")
-                    self.reconnect()
-
-                if self.serial:
-                    self.serial.reset_input_buffer()
-                    self.serial.reset_output_buffer()
-
-                result = self.master.execute(self.address, 6, register, 1, value)
-                return result[0]
-            except (SerialException, OSError, ModbusInvalidResponseError) as e:
-                print(f" Write failed ({attempt}/{retries}): {e}")
-                if isinstance(e, (SerialException, OSError)):
-                    self.reconnect()
-                time.sleep(delay)
-
-        print(f"Failed to write register {register} after {retries} retries.")
-        return None
-
-
-    # def write_multiple(self, register: int, values: tuple or list) -> tuple:
-    #     try:
-    #         return self.master.execute(
-    #             self.address, WRITE_MULTIPLE_REGISTERS, register, 1, values
-    #         )
-    #     except ModbusInvalidResponseError:
-    #         return self.write_multiple(register, values)
-    def write_multiple(self, register: int, values: list[int] | tuple[int, ...], retries=3, delay=0.2):
-        for attempt in range(retries):
-            try:
-                return self.master.execute(self.address, WRITE_MULTIPLE_REGISTERS, register, 1, values)
-            except ModbusInvalidResponseError as e:
-                print(f"Write multiple failed ({attempt+1}/{retries}): {e}")
-                time.sleep(delay)
-        print("Failed to write multiple registers after retries")
+                    self._close_serial()
+                    if connector:
+                        return None  # connect()/_recover() pace their own retries
+                    self._link_down(e)
+                    raise RidenUnavailable(f"Riden on {self.port} is unavailable, reconnecting") from e
+                if delay is not None:
+                    time.sleep(delay)
+                elif self.adaptive:
+                    time.sleep(self.rtt.retry_delay(key, attempt))
+                else:
+                    time.sleep(0.2)
+        if not connector:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._link_down(f"{self._failures} requests unanswered")
+                raise RidenUnavailable(f"Riden on {self.port} is not answering, reconnecting")
         return None
-        
-    def init(self):
-        data = self.read(0, 10)  # example: read 10 registers starting at 0
-        if data is None:
-            print("Unable to initialize device — Modbus read failed.")
-            self.id = 0
-            
-            return
-
-        try:
-            self.id = self.get_id(data[R.ID])
-            #self.type = self.get_type(data[R.TYPE])
-        except Exception as e:
-            print(f"Error parsing init data: {e}")
-            self.id = 0
 
-    def init_device(self):
-        try:
-            self.init()
-            print(f"Riden init successful, ID={self.id}")
-        except Exception as e:
-            print(f"⚠️ Riden init_device() failed: {e}")           
+    def read(self, register, length=1, retries=3, delay=None, priority=TELEMETRY):
+        response = self._transact(3, register, length, retries=retries, delay=delay, priority=priority)
+        if response is None:
+            print(f" Failed to read register {register} after {retries} retries.")
+            return None
+        return response if length > 1 else response[0]
+
+    def write(self, register, value, retries=3, delay=None, priority=CONTROL, force=False):
+        """Write one holding register.
+
+        Writes to SHADOW_REGISTERS are skipped when the raw value matches the
+        last state confirmed by a write or update(), unless ``force`` is set.
+        """
+        value = int(value)
+        if not force and register in SHADOW_REGISTERS and self._shadow.get(register) == value:
+            self.metrics.count("skipped_writes")
+            return register
+        self._shadow_writes += 1
+        self._shadow.pop(register, None)
+        result = self._transact(6, register, 1, value, retries, delay, "Write", priority)
+        if result is None:
+            print(f"Failed to write register {register} after {retries} retries.")
+            return None
+        self._shadow[register] = value
+        self.updated_at = None  # Setpoints changed, snapshot is stale
+        return result[0]
+
+    def stats(self) -> dict:
+        """Snapshot of per-operation latency histograms and error counters."""
+        stats = self.metrics.snapshot()
+        stats["transactions"] = self.transactions
+        return stats
+
+    def bus_stats(self) -> dict:
+        """Queue depth and wait-time metrics per priority class."""
+        return self.bus.stats()
+
+    def rtt_stats(self) -> dict:
+        """Round-trip statistics and derived timeouts per (function code, length)."""
+        return self.rtt.stats()
+
+    def read_registers(self, registers, max_gap=None) -> dict:
+        """Read any set of registers in the fewest FC3 requests.
+
+        ``max_gap`` overrides the instance gap tolerance. Returns a dict of
+        register -> raw value, or None if any block read failed.
+        """
+        if max_gap is None:
+            max_gap = self.max_gap
+        data = {}
+        for start, length in plan_reads(registers, max_gap):
+            block = self.read(start, length)
+            if block is None:
+                return None
+            if length == 1:
+                block = (block,)
+            data.update(zip(range(start, start + length), block))
+        return data
+
+    def write_multiple(
+        self, register: int, values: list[int] | tuple[int, ...], retries=3, delay=None, priority=CONTROL, force=False
+    ):
+        """Write consecutive holding registers in one FC16 request.
+
+        Skipped like write() when every register is shadowed and already
+        holds its value, unless ``force`` is set.
+        """
+        values = [int(value) for value in values]
+        registers = range(register, register + len(values))
+        if not force and all(
+            r in SHADOW_REGISTERS and self._shadow.get(r) == value for r, value in zip(registers, values)
+        ):
+            self.metrics.count("skipped_writes")
+            return register, len(values)
+        self._shadow_writes += 1
+        for r in registers:
+            self._shadow.pop(r, None)
+        result = self._transact(
+            WRITE_MULTIPLE_REGISTERS, register, len(values), values, retries, delay, "Write multiple", priority
+        )
+        if result is None:
+            print(f"Failed to write registers {register}-{registers[-1]} after {retries} retries.")
+            return None
+        self._shadow.update((r, value) for r, value in zip(registers, values) if r in SHADOW_REGISTERS)
+        self.updated_at = None  # Setpoints changed, snapshot is stale
+        return result
 
     def get_id(self, _id: int = None) -> int:
-        self.id = _id or self.read(R.ID)
+        if _id is None:
+            _id = self.read(R.ID, priority=CONFIG)
+        self.id = _id
         return self.id
 
     def get_sn(self, _sn_h: int = None, _sn_l: int = None) -> str:
-        _sn_h = _sn_h or self.read(R.SN_H)
-        _sn_l = _sn_l or self.read(R.SN_L)
+        if _sn_h is None or _sn_l is None:
+            _sn_h, _sn_l = self.read(R.SN_H, 2, priority=CONFIG)
         self.sn = "%08d" % (_sn_h << 16 | _sn_l)
         return self.sn
 
     def get_fw(self, _fw: int = None) -> int:
-        self.fw = _fw or self.read(R.FW)
+        if _fw is None:
+            _fw = self.read(R.FW, priority=CONFIG)
+        self.fw = _fw
         return self.fw
 
     def update(self) -> None:
-        data = (None,) * 4  # Fix offset - Init registers
-        data += self.read(R.INT_C_S, (R.I_RANGE - R.INT_C_S) + 1)
+        """Fetch UPDATE_REGISTERS in its planned block reads and decode them."""
+        if self.status == "idle":
+            self.start_connect()  # Lazy mode: the first snapshot comes with connect()
+            return
+        writes = self._shadow_writes
+        data = self.read_registers(UPDATE_REGISTERS)
+        if data is None:
+            print("Riden update failed — Modbus read failed.")
+            return
+        self._publish(data, writes)
+
+    def _publish(self, data, writes: int) -> None:
+        state = self.decode(data)
+        # Resync the shadow unless a write raced with the block read
+        if writes == self._shadow_writes:
+            for register in SHADOW_REGISTERS:
+                if register in data:
+                    self._shadow[register] = data[register]
+        self.updated_at = time.monotonic()
+        self.state = state
+        if self.history is not None:
+            self.history.append(state)
+
+    def get_state(self) -> dict:
+        """Latest published snapshot as a dict (None before the first update)."""
+        state = self.state
+        return state._asdict() if state else None
+
+    def start_poller(self, interval: float = 0.5) -> None:
+        """Run update() every interval seconds in a background thread.
+
+        Readers pick up self.state (or the cached getters) without waiting on
+        the bus; only the poller and explicit writes generate traffic.
+        """
+        if self._poller and self._poller.is_alive():
+            print("Riden poller already running.")
+            return
+        self._poller_stop.clear()
+        self._poller = threading.Thread(
+            target=self._poll_loop, args=(interval,), daemon=True
+        )
+        self._poller.start()
+
+    def stop_poller(self) -> None:
+        self._poller_stop.set()
+        if self._poller and self._poller is not threading.current_thread():
+            self._poller.join()
+        self._poller = None
+
+    def _poll_loop(self, interval: float) -> None:
+        deadline = time.monotonic()
+        while not self._poller_stop.is_set():
+            try:
+                if self.status == "ready":
+                    self.update()
+            except RidenUnavailable:
+                pass  # _recover() publishes the next state
+            except Exception as e:
+                print(f" Riden poll failed: {e}")
+            deadline += interval
+            delay = deadline - time.monotonic()
+            if delay < 0:  # Overran, don't try to catch up with a burst
+                deadline = time.monotonic()
+                delay = 0
+            self._poller_stop.wait(delay)
+
+    def _from_snapshot(self, field: str) -> bool:
+        """In cache mode, make sure the snapshot is fresh enough for field.
+
+        Returns True when the getter may answer from its attribute, running
+        update() first if the snapshot is older than the field's max age.
+        If that refresh fails the stale snapshot is not served: False sends
+        the getter to a direct register read.
+        """
+        if not self.cache:
+            return False
+        max_age = self.field_max_age.get(field, self.max_age)
+        updated_at = self.updated_at
+        if updated_at is not None and time.monotonic() - updated_at <= max_age:
+            return True
+        self.update()
+        return self.updated_at is not None and self.updated_at != updated_at
+
+    def _compile_decoder(self):
+        i_range_multi = (10000, 1000) if self.type == "RD6012P" else None
+        return compile_decoder(self.v_multi, self.i_multi, self.p_multi, self.v_in_multi, i_range_multi)
+
+    def decode(self, data, timestamp: float = None) -> RidenState:
+        """Decode raw UPDATE_REGISTERS values without touching the bus.
+
+        Returns the RidenState and mirrors it onto the legacy attributes.
+        """
         if self.type == "RD6012P":
-            if data[R.I_RANGE] == 0:
-                self.i_multi = 10000
-            else:
-                self.i_multi = 1000
-        self.get_int_c(data[R.INT_C_S], data[R.INT_C])
-        self.get_int_f(data[R.INT_F_S], data[R.INT_F])
-        self.get_v_set(data[R.V_SET])
-        self.get_i_set(data[R.I_SET])
-        self.get_v_out(data[R.V_OUT])
-        self.get_i_out(data[R.I_OUT])
-        self.get_p_out(data[R.P_OUT])
-        self.get_v_in(data[R.V_IN])
-        self.is_keypad(data[R.KEYPAD])
-        self.get_ovp_ocp(data[R.OVP_OCP])
-        self.get_cv_cc(data[R.CV_CC])
-        self.is_output(data[R.OUTPUT])
-        self.get_preset(data[R.PRESET])
-        data += (None,) * 11  # Fix offset - Unused/Unknown registers
-        data += self.read(R.BAT_MODE, (R.WH_L - R.BAT_MODE) + 1)
-        self.is_bat_mode(data[R.BAT_MODE])
-        self.get_v_bat(data[R.V_BAT])
-        self.get_ext_c(data[R.EXT_C_S], data[R.EXT_C])
-        self.get_ext_f(data[R.EXT_F_S], data[R.EXT_F])
-        self.get_ah(data[R.AH_H], data[R.AH_L])
-        self.get_wh(data[R.WH_H], data[R.WH_L])
+            self.i_multi = 10000 if data[R.I_RANGE] == 0 else 1000
+        state = self._decoder(data, time.time() if timestamp is None else timestamp)
+        vars(self).update(zip(STATE_FIELDS, state[1:]))
+        return state
 
     def get_int_c(self, _int_c_s: int = None, _int_c: int = None) -> int:
-        _int_c_s = _int_c_s or self.read(R.INT_C_S)
-        _int_c = _int_c or self.read(R.INT_C)
+        if _int_c_s is None or _int_c is None:
+            if self._from_snapshot("int_c"):
+                return self.int_c
+            _int_c_s, _int_c = self.read(R.INT_C_S, 2)
         sign = -1 if _int_c_s else +1
         self.int_c = _int_c * sign
         return self.int_c
 
     def get_int_f(self, _int_f_s: int = None, _int_f: int = None) -> int:
-        _int_f_s = _int_f_s or self.read(R.INT_F_S)
-        _int_f = _int_f or self.read(R.INT_F)
+        if _int_f_s is None or _int_f is None:
+            if self._from_snapshot("int_f"):
+                return self.int_f
+            _int_f_s, _int_f = self.read(R.INT_F_S, 2)
         sign = -1 if _int_f_s else +1
         self.int_f = _int_f * sign
         return self.int_f
 
     def get_v_set(self, _v_set: int = None) -> float:
-        _v_set = _v_set or self.read(R.V_SET)
+        if _v_set is None:
+            if self._from_snapshot("v_set"):
+                return self.v_set
+            _v_set = self.read(R.V_SET)
         self.v_set = _v_set / self.v_multi
         return self.v_set
 
-    def set_v_set(self, v_set: float) -> float:
+    def set_v_set(self, v_set: float, force: bool = False) -> float:
         self.v_set = round(v_set * self.v_multi)
-        return self.write(R.V_SET, int(self.v_set))
+        return self.write(R.V_SET, int(self.v_set), force=force)
 
     def get_i_set(self, _i_set: int = None) -> float:
-        _i_set = _i_set or self.read(R.I_SET)
+        if _i_set is None:
+            if self._from_snapshot("i_set"):
+                return self.i_set
+            _i_set = self.read(R.I_SET)
         self.i_set = _i_set / self.i_multi
         return self.i_set
 
     
-    def set_i_set(self, i_set: float) -> float:
+    def set_i_set(self, i_set: float, force: bool = False) -> float:
         self.i_set = round(i_set * self.i_multi)
-        print(f"[DEBUG] set_i_set({i_set}) → writing {self.i_set} raw")
-        start = time.time()
+        priority = SAFETY if self.i_set == 0 else CONTROL
+        return self.write(R.I_SET, int(self.i_set), priority=priority, force=force)
 
-        result = self.write(R.I_SET, int(self.i_set))
 
-        duration = time.time() - start
-        print(f"[DEBUG] set_i_set done in {duration:.3f}s, result={result}")
-        return result
+    def set_vi(self, v_set: float, i_set: float, force: bool = False) -> tuple:
+        """Set V_SET and I_SET together in one FC16 request.
 
+        The registers are adjacent, so the device never runs a mixed
+        setpoint and the change costs a single round-trip.
+        """
+        v_raw = round(v_set * self.v_multi)
+        i_raw = round(i_set * self.i_multi)
+        priority = SAFETY if i_raw == 0 else CONTROL
+        return self.write_multiple(R.V_SET, (v_raw, i_raw), priority=priority, force=force)
 
     def get_v_out(self, _v_out: int = None) -> float:
-        _v_out = _v_out or self.read(R.V_OUT)
+        if _v_out is None:
+            if self._from_snapshot("v_out"):
+                return self.v_out
+            _v_out = self.read(R.V_OUT)
         self.v_out = _v_out / self.v_multi
         return self.v_out
 
     def get_i_out(self, _i_out: int = None) -> float:
-        _i_out = _i_out or self.read(R.I_OUT)
+        if _i_out is None:
+            if self._from_snapshot("i_out"):
+                return self.i_out
+            _i_out = self.read(R.I_OUT)
         self.i_out = _i_out / self.i_multi
         return self.i_out
 
     def get_p_out(self, _p_out: int = None) -> float:
-        _p_out = _p_out or self.read(R.P_OUT)
+        if _p_out is None:
+            if self._from_snapshot("p_out"):
+                return self.p_out
+            _p_out = self.read(R.P_OUT)
         self.p_out = _p_out / self.p_multi
         return self.p_out
 
     def get_v_in(self, _v_in: int = None) -> float:
-        _v_in = _v_in or self.read(R.V_IN)
+        if _v_in is None:
+            if self._from_snapshot("v_in"):
+                return self.v_in
+            _v_in = self.read(R.V_IN)
         self.v_in = _v_in / self.v_in_multi
         return self.v_in
 
     def is_keypad(self, _keypad: int = None) -> bool:
-        self.keypad = bool(_keypad or self.read(R.KEYPAD))
+        if _keypad is None:
+            if self._from_snapshot("keypad"):
+                return self.keypad
+            _keypad = self.read(R.KEYPAD)
+        self.keypad = bool(_keypad)
         return self.keypad
 
     def get_ovp_ocp(self, _ovp_ocp: int = None) -> str:
-        _ovp_ocp = _ovp_ocp or self.read(R.OVP_OCP)
+        if _ovp_ocp is None:
+            if self._from_snapshot("ovp_ocp"):
+                return self.ovp_ocp
+            _ovp_ocp = self.read(R.OVP_OCP)
         self.ovp_ocp = (
             "OVP" if _ovp_ocp == 1 else "OCP" if _ovp_ocp == 2 else None
         )
         return self.ovp_ocp
 
     def get_cv_cc(self, _cv_cc: int = None) -> str:
-        _cv_cc = _cv_cc or self.read(R.CV_CC)
+        if _cv_cc is None:
+            if self._from_snapshot("cv_cc"):
+                return self.cv_cc
+            _cv_cc = self.read(R.CV_CC)
         self.cv_cc = "CV" if _cv_cc == 0 else "CC" if _cv_cc == 1 else None
         return self.cv_cc
 
     def is_output(self, _output: int = None) -> bool:
-        self.output = bool(_output or self.read(R.OUTPUT))
+        if _output is None:
+            if self._from_snapshot("output"):
+                return self.output
+            _output = self.read(R.OUTPUT)
+        self.output = bool(_output)
         return self.output
 
-    def set_output(self, output: bool) -> None:
+    def set_output(self, output: bool, force: bool = False) -> None:
         self.output = output
-        return self.write(R.OUTPUT, int(self.output))
+        priority = CONTROL if self.output else SAFETY
+        return self.write(R.OUTPUT, int(self.output), priority=priority, force=force)
 
     def get_preset(self, _preset: int = None) -> int:
         "Always returns 0 on my device, setter works as expected"
-        self.preset = _preset or self.read(R.PRESET)
+        if _preset is None:
+            if self._from_snapshot("preset"):
+                return self.preset
+            _preset = self.read(R.PRESET)
+        self.preset = _preset
         return self.preset
 
     def set_preset(self, preset: int) -> int:
@@ -312,44 +830,59 @@ class Riden:
         return self.write(R.PRESET, self.preset)
 
     def is_bat_mode(self, _bat_mode: int = None) -> bool:
-        self.bat_mode = bool(_bat_mode or self.read(R.BAT_MODE))
+        if _bat_mode is None:
+            if self._from_snapshot("bat_mode"):
+                return self.bat_mode
+            _bat_mode = self.read(R.BAT_MODE)
+        self.bat_mode = bool(_bat_mode)
         return self.bat_mode
 
     def get_v_bat(self, _v_bat: int = None) -> float:
-        _v_bat = _v_bat or self.read(R.V_BAT)
+        if _v_bat is None:
+            if self._from_snapshot("v_bat"):
+                return self.v_bat
+            _v_bat = self.read(R.V_BAT)
         self.v_bat = _v_bat / self.v_multi
         return self.v_bat
 
     def get_ext_c(self, _ext_c_s: int = None, _ext_c: int = None) -> int:
-        _ext_c_s = _ext_c_s or self.read(R.EXT_C_S)
-        _ext_c = _ext_c or self.read(R.EXT_C)
+        if _ext_c_s is None or _ext_c is None:
+            if self._from_snapshot("ext_c"):
+                return self.ext_c
+            _ext_c_s, _ext_c = self.read(R.EXT_C_S, 2)
         sign = -1 if _ext_c_s else +1
         self.ext_c = _ext_c * sign
         return self.ext_c
 
     def get_ext_f(self, _ext_f_s: int = None, _ext_f: int = None) -> int:
-        _ext_f_s = _ext_f_s or self.read(R.EXT_F_S)
-        _ext_f = _ext_f or self.read(R.EXT_F)
+        if _ext_f_s is None or _ext_f is None:
+            if self._from_snapshot("ext_f"):
+                return self.ext_f
+            _ext_f_s, _ext_f = self.read(R.EXT_F_S, 2)
         sign = -1 if _ext_f_s else +1
         self.ext_f = _ext_f * sign
         return self.ext_f
 
     def get_ah(self, _ah_h: int = None, _ah_l: int = None) -> float:
-        _ah_h = _ah_h or self.read(R.AH_H)
-        _ah_l = _ah_l or self.read(R.AH_L)
+        if _ah_h is None or _ah_l is None:
+            if self._from_snapshot("ah"):
+                return self.ah
+            _ah_h, _ah_l = self.read(R.AH_H, 2)
         self.ah = (_ah_h << 16 | _ah_l) / 1000
         return self.ah
 
     def get_wh(self, _wh_h: int = None, _wh_l: int = None) -> float:
-        _wh_h = _wh_h or self.read(R.WH_H)
-        _wh_l = _wh_l or self.read(R.WH_L)
+        if _wh_h is None or _wh_l is None:
+            if self._from_snapshot("wh"):
+                return self.wh
+            _wh_h, _wh_l = self.read(R.WH_H, 2)
         self.wh = (_wh_h << 16 | _wh_l) / 1000
         return self.wh
 
     def get_date_time(self) -> datetime:
         if self.type == "RK6006":
             return
-        d = self.read(R.YEAR, 6)
+        d = self.read(R.YEAR, 6, priority=CONFIG)
         self.datetime = datetime(d[0], d[1], d[2], d[3], d[4], d[5])
         return self.datetime
 
@@ -359,7 +892,9 @@ class Riden:
         )
 
     def is_take_ok(self, _take_ok: int = None) -> bool:
-        self.take_ok = bool(_take_ok or self.read(R.OPT_TAKE_OK))
+        if _take_ok is None:
+            _take_ok = self.read(R.OPT_TAKE_OK, priority=CONFIG)
+        self.take_ok = bool(_take_ok)
         return self.take_ok
 
     def set_take_ok(self, take_ok: bool) -> bool:
@@ -367,7 +902,9 @@ class Riden:
         return self.write(R.OPT_TAKE_OK, self.take_ok)
 
     def is_take_out(self, _take_out: int = None) -> bool:
-        self.take_out = bool(_take_out or self.read(R.OPT_TAKE_OUT))
+        if _take_out is None:
+            _take_out = self.read(R.OPT_TAKE_OUT, priority=CONFIG)
+        self.take_out = bool(_take_out)
         return self.take_out
 
     def set_take_out(self, take_out: bool) -> bool:
@@ -375,7 +912,9 @@ class Riden:
         return self.write(R.OPT_TAKE_OUT, self.take_out)
 
     def is_boot_pow(self, _boot_pow: int = None) -> bool:
-        self.boot_pow = bool(_boot_pow or self.read(R.OPT_BOOT_POW))
+        if _boot_pow is None:
+            _boot_pow = self.read(R.OPT_BOOT_POW, priority=CONFIG)
+        self.boot_pow = bool(_boot_pow)
         return self.boot_pow
 
     def set_boot_pow(self, boot_pow: bool) -> bool:
@@ -383,7 +922,9 @@ class Riden:
         return self.write(R.OPT_BOOT_POW, self.boot_pow)
 
     def is_buzz(self, _buzz: int = None) -> bool:
-        self.buzz = bool(_buzz or self.read(R.OPT_BUZZ))
+        if _buzz is None:
+            _buzz = self.read(R.OPT_BUZZ, priority=CONFIG)
+        self.buzz = bool(_buzz)
         return self.buzz
 
     def set_buzz(self, buzz: bool) -> bool:
@@ -391,7 +932,9 @@ class Riden:
         return self.write(R.OPT_BUZZ, self.buzz)
 
     def is_logo(self, _logo: int = None) -> bool:
-        self.logo = bool(_logo or self.read(R.OPT_LOGO))
+        if _logo is None:
+            _logo = self.read(R.OPT_LOGO, priority=CONFIG)
+        self.logo = bool(_logo)
         return self.logo
 
     def set_logo(self, logo: bool) -> bool:
@@ -399,7 +942,7 @@ class Riden:
         return self.write(R.OPT_LOGO, self.logo)
 
     def get_lang(self) -> int:
-        self.lang = self.read(R.OPT_LANG)
+        self.lang = self.read(R.OPT_LANG, priority=CONFIG)
         return self.lang
 
     def set_lang(self, lang: int) -> int:
@@ -407,13 +950,49 @@ class Riden:
         return self.write(R.OPT_LANG, self.lang)
 
     def get_light(self) -> int:
-        self.light = self.read(R.OPT_LIGHT)
+        self.light = self.read(R.OPT_LIGHT, priority=CONFIG)
         return self.light
 
     def set_light(self, light: int) -> int:
         self.light = light
         return self.write(R.OPT_LIGHT, self.light)
 
+    def export_config(self) -> dict:
+        """Read options and presets M0-M9 as raw register values by name.
+
+        Costs one FC3 request per contiguous range (two with the default
+        gap tolerance). Returns None if the read failed.
+        """
+        data = self.read_registers(CONFIG_REGISTERS)
+        if data is None:
+            return None
+        return {
+            "type": self.type,
+            "registers": {_CONFIG_NAMES[r]: data[r] for r in CONFIG_REGISTERS},
+        }
+
+    def import_config(self, config: dict, max_gap: int = 2) -> int:
+        """Write back an export_config() snapshot, changed registers only.
+
+        Changed registers are grouped into FC16 requests, bridging runs of
+        up to max_gap unchanged registers. Returns the number of registers
+        that differed, or None if reading or writing failed.
+        """
+        if config.get("type") != self.type:
+            raise ValueError(f"Config is for {config.get('type')}, device is {self.type}")
+        names = {name: r for r, name in _CONFIG_NAMES.items()}
+        target = {names[name]: int(value) for name, value in config["registers"].items()}
+        # Same gap tolerance as the writes, so bridged registers are known
+        current = self.read_registers(target, max(self.max_gap, max_gap))
+        if current is None:
+            return None
+        changed = [r for r, value in target.items() if current[r] != value]
+        for start, length in plan_reads(changed, max_gap, MAX_WRITE):
+            values = [target.get(r, current[r]) for r in range(start, start + length)]
+            if self.write_multiple(start, values, force=True) is None:
+                return None
+        return len(changed)
+
     def reboot_bootloader(self) -> None:
         try:
             self.write(R.SYSTEM, R.BOOTLOADER)
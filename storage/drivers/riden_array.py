@@ -0,0 +1,311 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .riden import Riden, RidenUnavailable
+
+# Maximum output current per model (A), used to share a current target
+CAPACITY = {
+    "RD6024": 24.0,
+    "RD6018": 18.0,
+    "RD6012": 12.0,
+    "RD6012P": 12.0,
+    "RD6006": 6.0,
+    "RD6006P": 6.0,
+    "RK6006": 6.0,
+}
+
+
+class RidenArray:
+    """Several Riden units in parallel on one battery, driven as one charger.
+
+    Each unit keeps its own port and poller thread, so telemetry from all
+    units is refreshed concurrently and a cycle takes as long as the slowest
+    unit rather than the sum. Setpoints go out to all units at once from a
+    worker pool. A total current target is split in proportion to each
+    unit's capacity across the units that are ready. A unit whose link is
+    down (see Riden.health()) may still be charging at its last setpoint,
+    so that current is taken off the target for the others until the unit
+    recovers; the total never exceeds the target. A unit never reached at
+    all (e.g. still connecting at startup) may run its panel setpoint, so
+    it counts at full capacity.
+
+    A unit that comes back (maybe power cycled) first gets the array's
+    V_SET and output state at 0 A, then the last current target is split
+    again. ``status_hook(port, old, new)`` sees every unit's transitions.
+
+    Implements the Riden calls the server and control loop use, so it can
+    stand in for a single charger.
+    """
+
+    def __init__(self, ports, capacities=None, status_hook=None, **riden_kwargs):
+        if not ports:
+            raise ValueError("RidenArray needs at least one port")
+        self.capacities = dict(capacities or {})  # port -> A, overrides CAPACITY
+        self.i_target = None  # Last total current requested with set_i_set()
+        self.v_target = None  # Last set_v_set(), re-applied to recovering units
+        self.output_target = None  # Last set_output(), likewise
+        self.shares = {}  # unit -> amps last set, presumed live while the unit is down
+        self._stopped = set()  # Units switched off because I_SET 0 failed
+        self.polling = False
+        self.status_hook = status_hook
+        self._lock = threading.Lock()  # Serialises current splits
+        riden_kwargs.setdefault("connect", "background")
+        riden_kwargs.setdefault("cache", True)
+        self.units = [
+            Riden(port=port, status_hook=lambda old, new, port=port: self._on_status(port, old, new), **riden_kwargs)
+            for port in ports
+        ]
+        self._pool = ThreadPoolExecutor(max_workers=len(self.units), thread_name_prefix="riden-array")
+
+    # ---- Units ----
+    def ready_units(self) -> list:
+        return [unit for unit in self.units if unit.is_ready()]
+
+    def capacity(self, unit) -> float:
+        if unit.port in self.capacities:
+            return self.capacities[unit.port]
+        return CAPACITY.get(unit.type, 0.0)
+
+    def is_ready(self) -> bool:
+        return any(unit.is_ready() for unit in self.units)
+
+    @property
+    def status(self) -> str:
+        statuses = [unit.status for unit in self.units]
+        for status in ("ready", "connecting", "unavailable"):
+            if status in statuses:
+                return status
+        return statuses[0]
+
+    def health(self) -> dict:
+        return {unit.port: unit.health() for unit in self.units}
+
+    def _on_status(self, port, old, new) -> None:
+        if self.status_hook:
+            try:
+                self.status_hook(port, old, new)
+            except Exception as e:
+                print(f" Status hook failed: {e}")
+        targets = (self.i_target, self.v_target, self.output_target)
+        if "ready" in (old, new) and any(target is not None for target in targets):
+            # Off the calling thread: it may be a pool worker mid-write
+            threading.Thread(target=self._rebalance, args=(port, new), daemon=True).start()
+
+    def _rebalance(self, port, new) -> None:
+        try:
+            if new == "ready":
+                with self._lock:
+                    self._restore(next(unit for unit in self.units if unit.port == port))
+            if self.i_target is not None:
+                ready = len(self.ready_units())
+                print(f"Riden array: {ready}/{len(self.units)} units ready, resharing {self.i_target} A")
+                self.set_i_set(self.i_target)
+        except RidenUnavailable as e:
+            print(f" Riden array: rebalance failed: {e}")
+
+    def _restore(self, unit) -> None:
+        """Give a unit the array's V_SET and output state, at 0 A until the next split."""
+        if unit.set_i_set(0, force=True) is None:
+            raise RidenUnavailable(f"{unit.port} did not take I_SET 0")
+        self.shares[unit] = 0.0
+        if self.v_target is not None:
+            unit.set_v_set(self.v_target, force=True)
+        if self.output_target is not None:
+            unit.set_output(self.output_target, force=True)
+        self._stopped.discard(unit)
+
+    def _presumed(self, unit) -> float:
+        """Current a unit that cannot be written may still be delivering (A)."""
+        if unit in self.shares:
+            return self.shares[unit]
+        if unit.state is not None:  # Last snapshot before it went down
+            return unit.state.i_set if unit.state.output else 0.0
+        return self.capacity(unit) or max(CAPACITY.values())
+
+    def _stop(self, unit) -> bool:
+        """Make sure a unit delivers no current: I_SET 0, else output off."""
+        try:
+            if unit.set_i_set(0, force=True) is not None:
+                self.shares[unit] = 0.0
+                return True
+            if unit.set_output(False, force=True) is not None:
+                self.shares[unit] = 0.0
+                self._stopped.add(unit)
+                return True
+        except RidenUnavailable:
+            pass
+        return False
+
+    def _each(self, call, units=None) -> dict:
+        """Run call(unit) on every unit concurrently; unit -> result or exception."""
+        units = self.ready_units() if units is None else units
+        futures = {unit: self._pool.submit(call, unit) for unit in units}
+        results = {}
+        for unit, future in futures.items():
+            try:
+                results[unit] = future.result()
+            except Exception as e:
+                print(f" Riden array: {unit.port} failed: {e}")
+                results[unit] = e
+        return results
+
+    # ---- Polling ----
+    def start_poller(self, interval: float = 0.5) -> None:
+        """Start every unit's own poller; getters then never touch the bus."""
+        for unit in self.units:
+            unit.start_poller(interval)
+        self.polling = True
+
+    def stop_poller(self) -> None:
+        for unit in self.units:
+            unit.stop_poller()
+        self.polling = False
+
+    def update(self) -> None:
+        """One update() on all ready units at once."""
+        self._each(lambda unit: unit.update())
+
+    # ---- Setpoints ----
+    def split_current(self, i_total: float, units=None) -> dict:
+        """Share i_total across units by capacity; unit -> amps."""
+        units = [unit for unit in (self.ready_units() if units is None else units) if self.capacity(unit) > 0]
+        total_capacity = sum(self.capacity(unit) for unit in units)
+        if not total_capacity:
+            return {}
+        i_total = min(max(i_total, 0.0), total_capacity)
+        return {unit: i_total * self.capacity(unit) / total_capacity for unit in units}
+
+    def set_i_set(self, i_set: float, force: bool = False) -> float:
+        """Command a total charge current; returns the total actually set.
+
+        Units that are down keep the current they may still be delivering
+        (see _presumed()), so the ready units share what is left of the
+        target. A unit that fails the write is brought to 0 A (or its output
+        switched off) and the rest are split again. When that cannot be
+        confirmed, the unit counts at the larger of its old and new share,
+        the rest are split around it and RidenUnavailable is raised, so the
+        total stays within the target either way.
+        """
+        with self._lock:
+            self.i_target = i_set
+            units = self.ready_units()
+            for unit in [unit for unit in units if unit in self._stopped]:
+                try:
+                    self._restore(unit)
+                except RidenUnavailable as e:
+                    print(f" Riden array: {e}, leaving its output off")
+                    units.remove(unit)
+            stuck = []
+            while True:
+                held = sum(self._presumed(unit) for unit in self.units if unit not in units)
+                shares = self.split_current(max(i_set - held, 0.0), units)
+                failed = self._failed(self._each(lambda unit: unit.set_i_set(shares[unit], force=force), list(shares)))
+                for unit, amps in shares.items():
+                    if unit not in failed:
+                        self.shares[unit] = amps
+                        continue
+                    # The write may or may not have landed
+                    self.shares[unit] = max(self._presumed(unit), amps)
+                    if not self._stop(unit):
+                        stuck.append(unit)
+                if not failed:
+                    break
+                units = [unit for unit in units if unit not in failed]
+        if stuck:
+            ports = ", ".join(unit.port for unit in stuck)
+            raise RidenUnavailable(f"I_SET failed on {ports} and 0 A could not be confirmed")
+        return sum(shares.values())
+
+    @staticmethod
+    def _failed(results) -> list:
+        return [unit for unit, result in results.items() if result is None or isinstance(result, Exception)]
+
+    def set_v_set(self, v_set: float, force: bool = False) -> float:
+        """Same voltage on every unit, as they share one battery.
+
+        Raises RidenUnavailable when any unit is down or did not take it;
+        the others keep the new value and recovering units get it too.
+        """
+        with self._lock:
+            self.v_target = v_set
+            failed = self._failed(self._each(lambda unit: unit.set_v_set(v_set, force=force), self.units))
+        if failed:
+            raise RidenUnavailable(f"V_SET not set on {', '.join(unit.port for unit in failed)}")
+        return v_set
+
+    def set_output(self, output: bool, force: bool = False) -> None:
+        """Switch every unit's output.
+
+        Switching off, a unit that does not take it is brought to 0 A
+        instead. Raises RidenUnavailable when any unit is down or could not
+        be switched (or, switching off, confirmed at 0 A).
+        """
+        with self._lock:
+            self.output_target = output
+            failed = self._failed(self._each(lambda unit: unit.set_output(output, force=force), self.units))
+            if not output:
+                failed = [unit for unit in failed if not (unit.is_ready() and self._stop(unit))]
+        if failed:
+            state = "on" if output else "off"
+            raise RidenUnavailable(f"Output not switched {state} on {', '.join(unit.port for unit in failed)}")
+
+    # ---- Telemetry ----
+    def get_state(self) -> dict:
+        """Aggregate of the latest snapshots of the ready units.
+
+        Currents, power and counters are summed, voltages averaged, and
+        ``output`` is True when any unit is on. Per-unit states are under
+        ``units`` keyed by port, None for units that are not ready.
+        """
+        if not self.polling:
+            self.update()
+        states = {unit.port: unit.state if unit.is_ready() else None for unit in self.units}
+        live = [state for state in states.values() if state is not None]
+        if not live:
+            return None
+        total = lambda field: sum(getattr(state, field) for state in live)
+        mean = lambda field: total(field) / len(live)
+        return {
+            "timestamp": min(state.timestamp for state in live),
+            "units_ready": len(live),
+            "units_total": len(self.units),
+            "v_set": mean("v_set"),
+            "i_set": total("i_set"),
+            "v_out": mean("v_out"),
+            "i_out": total("i_out"),
+            "p_out": total("p_out"),
+            "v_in": mean("v_in"),
+            "output": any(state.output for state in live),
+            "ah": total("ah"),
+            "wh": total("wh"),
+            "units": {port: state._asdict() if state else None for port, state in states.items()},
+        }
+
+    def _field(self, field):
+        state = self.get_state()
+        if state is None:
+            raise RidenUnavailable("No Riden in the array is ready")
+        return state[field]
+
+    def get_v_set(self) -> float:
+        return self._field("v_set")
+
+    def get_i_set(self) -> float:
+        return self._field("i_set")
+
+    def get_v_out(self) -> float:
+        return self._field("v_out")
+
+    def get_i_out(self) -> float:
+        return self._field("i_out")
+
+    def get_p_out(self) -> float:
+        return self._field("p_out")
+
+    def is_output(self) -> bool:
+        return self._field("output")
+
+    def close(self) -> None:
+        self.stop_poller()
+        self._pool.shutdown(wait=False)
+        for unit in self.units:
+            unit._close_serial()
@@ -0,0 +1,145 @@
+import struct
+import time
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+
+# Function codes used by the Riden
+READ_HOLDING_REGISTERS = 3
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_REGISTERS = 16
+
+# Largest register count a single FC16 request may write
+MAX_WRITE = 123
+
+# Exception responses: slave, function | 0x80, exception code, CRC
+EXCEPTION_LENGTH = 5
+
+
+def _crc_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(frame: bytes) -> int:
+    """Modbus CRC16 of frame (little-endian on the wire)."""
+    crc = 0xFFFF
+    table = _CRC_TABLE
+    for byte in frame:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def build_request(slave, function_code, starting_address, quantity_of_x=0, output_value=0) -> bytes:
+    """Build a complete RTU request frame, CRC included.
+
+    Arguments follow modbus_tk's ``execute()`` for the FC3/FC6/FC16 subset.
+    """
+    if function_code == READ_HOLDING_REGISTERS:
+        frame = struct.pack(">BBHH", slave, function_code, starting_address, quantity_of_x)
+    elif function_code == WRITE_SINGLE_REGISTER:
+        frame = struct.pack(">BBHH", slave, function_code, starting_address, output_value)
+    elif function_code == WRITE_MULTIPLE_REGISTERS:
+        count = len(output_value)
+        frame = struct.pack(
+            ">BBHHB%dH" % count, slave, function_code, starting_address, count, 2 * count, *output_value
+        )
+    else:
+        raise ValueError(f"Unsupported function code {function_code}")
+    return frame + struct.pack("<H", crc16(frame))
+
+
+def response_length(function_code, quantity_of_x=0) -> int:
+    """Length of a normal (non-exception) response frame."""
+    if function_code == READ_HOLDING_REGISTERS:
+        return 5 + 2 * quantity_of_x
+    return 8
+
+
+def parse_response(slave, function_code, response: bytes) -> tuple:
+    """Validate a response frame and return its data like modbus_tk does.
+
+    FC3 yields the register values, FC6 (address, value) and FC16
+    (address, quantity). Raises ModbusInvalidResponseError on framing or CRC
+    problems and ModbusError for exception responses.
+    """
+    if len(response) < EXCEPTION_LENGTH:
+        raise ModbusInvalidResponseError(f"Response length is invalid {len(response)}")
+    if struct.unpack("<H", response[-2:])[0] != crc16(response[:-2]):
+        raise ModbusInvalidResponseError("Invalid CRC in response")
+    if response[0] != slave:
+        raise ModbusInvalidResponseError(f"Response address {response[0]} is different from request address {slave}")
+    if response[1] == function_code | 0x80:
+        raise ModbusError(response[2])
+    if response[1] != function_code:
+        raise ModbusInvalidResponseError(f"Response function code {response[1]} is not {function_code}")
+    if function_code == READ_HOLDING_REGISTERS:
+        count = response[2] // 2
+        if len(response) != 5 + 2 * count:
+            raise ModbusInvalidResponseError(f"Response length is invalid {len(response)}")
+        return struct.unpack_from(">%dH" % count, response, 3)
+    return struct.unpack_from(">HH", response, 2)
+
+
+class RtuTransport:
+    """Lean Modbus RTU master for the FC3/FC6/FC16 subset the Riden uses.
+
+    A drop-in for modbus_tk's ``RtuMaster`` as far as Riden is concerned
+    (``execute()`` and ``set_timeout()``), without hook dispatch or logging.
+    Request frames are packed into preallocated buffers. Up to 19200 baud
+    the 3.5 character inter-frame silence is kept between the last byte
+    received and the next request; above that, like RtuMaster, the time
+    spent handling the response covers it, as a sub-millisecond sleep
+    costs more than the silence itself.
+    """
+
+    def __init__(self, serial):
+        self._serial = serial
+        char_time = 11 / serial.baudrate  # start + 8 data + parity/stop bits
+        self._silence = 3.5 * char_time if serial.baudrate <= 19200 else 0.0
+        self._last_io = 0.0
+        self._short = bytearray(8)  # FC3/FC6 requests
+        self._long = bytearray(9 + 2 * MAX_WRITE)  # FC16 requests
+
+    def set_timeout(self, timeout_in_sec):
+        self._serial.timeout = timeout_in_sec
+
+    def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, threadsafe=True):
+        # threadsafe is accepted for RtuMaster compatibility; callers serialise
+        if function_code == WRITE_MULTIPLE_REGISTERS:
+            count = len(output_value)
+            buffer = self._long
+            struct.pack_into(
+                ">BBHHB%dH" % count, buffer, 0, slave, function_code, starting_address, count, 2 * count,
+                *output_value
+            )
+            size = 7 + 2 * count
+        elif function_code in (READ_HOLDING_REGISTERS, WRITE_SINGLE_REGISTER):
+            buffer = self._short
+            struct.pack_into(
+                ">BBHH", buffer, 0, slave, function_code, starting_address,
+                quantity_of_x if function_code == READ_HOLDING_REGISTERS else output_value,
+            )
+            size = 6
+        else:
+            raise ValueError(f"Unsupported function code {function_code}")
+        view = memoryview(buffer)
+        struct.pack_into("<H", buffer, size, crc16(view[:size]))
+
+        if self._silence:
+            wait = self._last_io + self._silence - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        serial = self._serial
+        serial.write(view[:size + 2])
+        response = serial.read(EXCEPTION_LENGTH)
+        if len(response) == EXCEPTION_LENGTH and not response[1] & 0x80:
+            response += serial.read(response_length(function_code, quantity_of_x) - EXCEPTION_LENGTH)
+        self._last_io = time.monotonic()
+        return parse_response(slave, function_code, response)
@@ -0,0 +1,83 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Priority classes, most urgent first
+SAFETY = 0  # I_SET=0, output off
+CONTROL = 1  # Setpoint and other writes
+TELEMETRY = 2  # Measurement reads
+CONFIG = 3  # Identification/option reads
+
+PRIORITY_NAMES = {SAFETY: "safety", CONTROL: "control", TELEMETRY: "telemetry", CONFIG: "config"}
+
+
+class BusScheduler:
+    """Serialises bus transactions, granting the bus in priority order.
+
+    Waiting threads are served lowest priority class first and FIFO within a
+    class. A transaction in flight is never interrupted, so a safety write
+    waits for at most the one running transaction. The owning thread may
+    re-enter (reconnect from inside a transaction).
+    """
+
+    def __init__(self, window=200):
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._owner = None
+        self._depth = 0
+        self._granted = {p: 0 for p in PRIORITY_NAMES}
+        self._waits = {p: deque(maxlen=window) for p in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self, priority=TELEMETRY):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+            else:
+                ticket = (priority, next(self._seq))
+                heapq.heappush(self._queue, ticket)
+                start = time.monotonic()
+                while self._owner is not None or self._queue[0] != ticket:
+                    self._cond.wait()
+                heapq.heappop(self._queue)
+                self._owner = me
+                self._depth = 1
+                self._granted[priority] += 1
+                self._waits[priority].append(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self._cond.notify_all()
+
+    def queue_depth(self) -> dict:
+        """Number of waiting transactions per priority class."""
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queue:
+                depth[PRIORITY_NAMES[priority]] += 1
+            return depth
+
+    def stats(self) -> dict:
+        """Grants, current queue depth and recent wait times per class."""
+        depth = self.queue_depth()
+        stats = {}
+        with self._cond:
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                stats[name] = {
+                    "granted": self._granted[priority],
+                    "queued": depth[name],
+                    "wait_mean": sum(waits) / len(waits) if waits else None,
+                    "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+                    "wait_max": waits[-1] if waits else None,
+                }
+        return stats
@@ -0,0 +1,223 @@
+import os
+import random
+import struct
+import termios
+import threading
+import time
+from .register import Register as R
+from .riden import model_for_id
+from .rtu import (
+    READ_HOLDING_REGISTERS,
+    WRITE_MULTIPLE_REGISTERS,
+    WRITE_SINGLE_REGISTER,
+    crc16,
+)
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+# termios speed constant -> baud rate
+_SPEEDS = {
+    getattr(termios, f"B{rate}"): rate
+    for rate in (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)
+}
+
+
+class RidenSimulator:
+    """Simulated RD60xx Modbus RTU slave for tests and benchmarks.
+
+    Implements the register map in register.py over a Linux pty pair
+    (``start()``, then point Riden at ``sim.port``) or in-process through
+    ``handle(request)``. The output drives a battery behind an internal
+    resistance, giving CC/CV behaviour, V/I/P, AH/WH and temperatures.
+    Response latency, dropped frames and corrupted CRCs are configurable.
+    With ``baudrate`` set, the pty only answers when the master opened it at
+    that rate (like a unit set to it in its menu) and the time the request
+    and response would spend on the wire is added to the latency.
+    """
+
+    def __init__(
+        self,
+        model_id=60181,
+        address=1,
+        sn=12345,
+        fw=140,
+        latency=0.0,
+        drop_rate=0.0,
+        crc_error_rate=0.0,
+        v_bat=51.2,
+        r_int=0.05,
+        v_in=60.0,
+        baudrate=None,
+        seed=None,
+    ):
+        self.address = address
+        self.type, self.v_multi, self.i_multi, self.p_multi = model_for_id(model_id)
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.crc_error_rate = crc_error_rate
+        self.v_bat = v_bat
+        self.r_int = r_int
+        self.v_in = v_in
+        self.baudrate = baudrate
+        self.random = random.Random(seed)
+        self.registers = [0] * (R.SYSTEM + 1)
+        self.registers[R.ID] = model_id
+        self.registers[R.SN_H], self.registers[R.SN_L] = sn >> 16, sn & 0xFFFF
+        self.registers[R.FW] = fw
+        self.registers[R.INT_C] = 25
+        self.registers[R.INT_F] = 77
+        self.registers[R.V_SET] = round(v_bat * self.v_multi)
+        self.registers[R.I_SET] = round(1.0 * self.i_multi)
+        self.registers[R.BAT_MODE] = 1
+        self.requests = 0  # Frames addressed to this slave
+        self.dropped = 0
+        self._ah = 0.0
+        self._wh = 0.0
+        self._last_step = time.monotonic()
+        self._lock = threading.Lock()
+        self._master_fd = None
+        self._slave_fd = None
+        self._thread = None
+        self.port = None
+        self.step()
+
+    # ---- Plant ----
+    def step(self) -> None:
+        """Advance the CC/CV plant to now and refresh the measurement registers."""
+        regs = self.registers
+        now = time.monotonic()
+        dt, self._last_step = now - self._last_step, now
+        v_set = regs[R.V_SET] / self.v_multi
+        i_set = regs[R.I_SET] / self.i_multi
+        if regs[R.OUTPUT]:
+            i_out = max(0.0, min(i_set, (v_set - self.v_bat) / self.r_int))
+            cc = i_out >= i_set
+            v_out = self.v_bat + i_out * self.r_int if cc else v_set
+        else:
+            i_out, cc, v_out = 0.0, False, self.v_bat
+        p_out = v_out * i_out
+        self._ah += i_out * dt / 3600
+        self._wh += p_out * dt / 3600
+        regs[R.V_OUT] = min(round(v_out * self.v_multi), 0xFFFF)
+        regs[R.I_OUT] = min(round(i_out * self.i_multi), 0xFFFF)
+        regs[R.P_OUT] = min(round(p_out * self.p_multi), 0xFFFF)
+        regs[R.V_IN] = round(self.v_in * 100)
+        regs[R.CV_CC] = int(cc)
+        regs[R.V_BAT] = round(self.v_bat * self.v_multi)
+        regs[R.EXT_C] = 22
+        regs[R.EXT_F] = 72
+        ah, wh = round(self._ah * 1000), round(self._wh * 1000)
+        regs[R.AH_H], regs[R.AH_L] = ah >> 16 & 0xFFFF, ah & 0xFFFF
+        regs[R.WH_H], regs[R.WH_L] = wh >> 16 & 0xFFFF, wh & 0xFFFF
+
+    # ---- Protocol ----
+    def handle(self, request: bytes):
+        """Answer one request frame; None when no response is sent."""
+        if len(request) < 8 or struct.unpack("<H", request[-2:])[0] != crc16(request[:-2]):
+            return None  # Real slaves stay silent on corrupt requests
+        slave, function_code = request[0], request[1]
+        if slave != self.address:
+            return None
+        with self._lock:
+            self.requests += 1
+            if self.random.random() < self.drop_rate:
+                self.dropped += 1
+                return None
+            self.step()
+            pdu = self._execute(function_code, request)
+        response = bytes([slave]) + pdu
+        crc = crc16(response)
+        if self.random.random() < self.crc_error_rate:
+            crc ^= 0xFFFF
+        return response + struct.pack("<H", crc)
+
+    def _execute(self, function_code, request) -> bytes:
+        regs = self.registers
+        start, count = struct.unpack_from(">HH", request, 2)
+        if function_code == READ_HOLDING_REGISTERS:
+            if start + count > len(regs):
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            return struct.pack(">BB%dH" % count, function_code, 2 * count, *regs[start:start + count])
+        if function_code == WRITE_SINGLE_REGISTER:
+            if start >= len(regs):
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            if start != R.SYSTEM:  # Bootloader magic is acknowledged, not stored
+                regs[start] = count
+            return request[1:6]
+        if function_code == WRITE_MULTIPLE_REGISTERS:
+            if start + count > len(regs):
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            regs[start:start + count] = struct.unpack_from(">%dH" % count, request, 7)
+            return request[1:6]
+        return bytes([function_code | 0x80, ILLEGAL_FUNCTION])
+
+    @staticmethod
+    def _frame_length(buffer: bytes):
+        """Length of the request at the start of buffer, None if incomplete."""
+        if len(buffer) < 2:
+            return None
+        if buffer[1] == WRITE_MULTIPLE_REGISTERS:
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+        return 8
+
+    # ---- pty transport ----
+    def start(self) -> str:
+        """Serve on a new pty pair; returns the device path for Riden(port=...)."""
+        import pty
+        import tty
+
+        self._master_fd, self._slave_fd = pty.openpty()
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self) -> None:
+        for fd in (self._master_fd, self._slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master_fd = self._slave_fd = None
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def _line_speed(self):
+        """Baud rate the master configured on the pty, None if unknown."""
+        try:
+            return _SPEEDS.get(termios.tcgetattr(self._slave_fd)[5])
+        except (termios.error, TypeError):
+            return None
+
+    def _serve(self) -> None:
+        buffer = b""
+        while self._master_fd is not None:
+            try:
+                buffer += os.read(self._master_fd, 512)
+            except OSError:
+                return
+            while True:
+                length = self._frame_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                request, buffer = buffer[:length], buffer[length:]
+                speed = self._line_speed()
+                if self.baudrate and speed != self.baudrate:
+                    buffer = b""  # Framing errors at the wrong rate, nothing understood
+                    continue
+                response = self.handle(request)
+                if response is None:
+                    buffer = b""  # Resynchronise on the next frame
+                    continue
+                delay = self.latency
+                if self.baudrate:
+                    delay += (len(request) + len(response)) * 11 / speed
+                if delay:
+                    time.sleep(delay)
+                try:
+                    os.write(self._master_fd, response)
+                except OSError:
+                    return
@@ -0,0 +1,26 @@
+from typing import NamedTuple, Optional
+
+
+class RidenState(NamedTuple):
+    """Immutable snapshot of one Riden update(), safe to share between threads."""
+
+    timestamp: float  # time.time() when the registers were read
+    int_c: int
+    int_f: int
+    v_set: float
+    i_set: float
+    v_out: float
+    i_out: float
+    p_out: float
+    v_in: float
+    keypad: bool
+    ovp_ocp: Optional[str]
+    cv_cc: Optional[str]
+    output: bool
+    preset: int
+    bat_mode: bool
+    v_bat: float
+    ext_c: int
+    ext_f: int
+    ah: float
+    wh: float
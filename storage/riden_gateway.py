@@ -0,0 +1,28 @@
+"""Share one Riden with many Modbus TCP clients.
+
+    python riden_gateway.py /dev/ttyUSB0 --listen 0.0.0.0:5020
+
+Home Assistant, Grafana collectors or scripts then talk Modbus TCP to this
+host (unit id is ignored) instead of opening the serial port themselves.
+There is no authentication: the default only listens on localhost, and
+writes are limited to setpoints, options, presets and the clock.
+"""
+import argparse
+from drivers.gateway import RidenGateway
+from drivers.riden import Riden
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("port", nargs="?", default="/dev/ttyUSB0")
+    parser.add_argument("--listen", default="127.0.0.1:5020", help="host:port to serve Modbus TCP on")
+    parser.add_argument("--ttl", type=float, default=0.2, help="Seconds a read is served from cache")
+    args = parser.parse_args()
+
+    host, _, port = args.listen.rpartition(":")
+    riden = Riden(port=args.port, connect="background")
+    RidenGateway(riden, ttl=args.ttl).serve_forever(host or "127.0.0.1", int(port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
 import json
 import threading
 import paho.mqtt.client as mqtt
-from drivers.riden import Riden
-from drivers.InverterController import InverterController
+from drivers.riden import Riden, RidenUnavailable
+from drivers.riden_array import RidenArray
+from drivers.InverterController import InverterController, SUMMARY_INTERVAL
+from drivers.InverterDispatcher import InverterDispatcher
+from drivers.PowerCalibration import PowerCalibration
 import time
 
 BROKER = "localhost"
 PORT = 1883
 TOPIC_CMD = "devices/command"
 TOPIC_RESP = "devices/response"
+# Charger ports; with more than one, the units run in parallel as a RidenArray
+CHARGER_PORTS = ["/dev/ttyUSB0"]
+# Inverter RS-485 buses and the number of units on each (None: one per bus);
+# with more than one bus (or unit) the total power is spread by an
+# InverterDispatcher
+INVERTER_PORTS = ["/dev/ttyUSB1"]
+INVERTER_UNITS = None
+# Learn the inverter's commanded -> actual curve from step responses and
+# correct set_power with it (single inverter only). Off until proven on the
+# real inverter.
+INVERTER_CALIBRATION = False
 
 # Thread lock for safety
 lock = threading.Lock()
@@ -18,13 +32,29 @@ charger = None
 inverter = None
 
 
+def log_charger_status(old, new, port=CHARGER_PORTS[0]):
+    print(f"Charger {port} {old} -> {new}")
+
+
 def connect_charger():
     global charger
     while True:
         try:
-            print("Trying to connect to charger on /dev/ttyUSB0...")
-            charger = Riden(port="/dev/ttyUSB0", baudrate=115200, address=1)
-            print(f"Connected to charger ID {charger.id}")
+            print(f"Trying to connect to charger on {', '.join(CHARGER_PORTS)}...")
+            # Connects in the background so startup does not wait for the unit;
+            # baud rate from calibrate_riden.py if stored, else 115200
+            if len(CHARGER_PORTS) > 1:
+                charger = RidenArray(
+                    CHARGER_PORTS, address=1, cache=True, max_age=0.4,
+                    status_hook=lambda port, old, new: log_charger_status(old, new, port),
+                )
+            else:
+                charger = Riden(
+                    port=CHARGER_PORTS[0], address=1, cache=True, max_age=0.4,
+                    connect="background", status_hook=log_charger_status,
+                )
+            charger.start_poller(0.25)
+            print(f"Charger is {charger.status}")
             return
         except Exception as e:
             print(" Charger connection failed, retrying in 5s:", e)
@@ -32,12 +62,20 @@ def connect_charger():
 
 
 def connect_inverter():
-    """Connect to InverterController on /dev/ttyUSB1 with retries."""
+    """Connect to the inverter(s) on INVERTER_PORTS with retries."""
     global inverter
     while True:
         try:
-            print("Trying to connect to inverter on /dev/ttyUSB1...")
-            inverter = InverterController(port="/dev/ttyUSB1", baud=4800)
+            print(f"Trying to connect to inverter on {', '.join(INVERTER_PORTS)}...")
+            units = INVERTER_UNITS or [1] * len(INVERTER_PORTS)
+            if len(INVERTER_PORTS) > 1 or units != [1]:
+                channels = [InverterController(port=port, baud=4800) for port in INVERTER_PORTS]
+                inverter = InverterDispatcher(channels, units=units, summary_interval=SUMMARY_INTERVAL)
+            else:
+                inverter = InverterController(port=INVERTER_PORTS[0], baud=4800, summary_interval=SUMMARY_INTERVAL)
+                if INVERTER_CALIBRATION:
+                    # set_power targets actual output, corrected by the learned curve
+                    inverter.Calibration = PowerCalibration(inverter.MaxPower)
             inverter.Connect()
             inverter.ThreadLooping(start_power=0)
             print("Inverter connected and control loop started")
@@ -65,9 +103,20 @@ def handle_command(payload: dict):
             if device == "riden":
                 if charger is None:
                     connect_charger()
-                if hasattr(charger, action):
+                # Health queries are answered even while the link is down
+                if not charger.is_ready() and action not in ("is_ready", "health"):
+                    response = {
+                        "status": "error",
+                        "device": "riden",
+                        "message": f"Charger is {charger.status}",
+                        "health": charger.health(),
+                    }
+                elif hasattr(charger, action):
                     method = getattr(charger, action)
-                    result = method(value) if value is not None else method()
+                    if isinstance(value, list):  # e.g. set_vi with [volts, amps]
+                        result = method(*value)
+                    else:
+                        result = method(value) if value is not None else method()
                     response = {
                         "status": "ok",
                         "device": "riden",
@@ -85,11 +134,27 @@ def handle_command(payload: dict):
                 if inverter is None:
                     connect_inverter()
                 if action == "set_power" and value is not None:
-                    inverter.ModifyPower(value)
+                    # value is watts, or [watts, ramp rate in W/s]
+                    power, ramp_rate = value if isinstance(value, list) else (value, None)
+                    try:
+                        inverter.ModifyPower(power, wait=True, ramp_rate=ramp_rate)  # Reply with the power on the wire
+                        response = {
+                            "status": "ok",
+                            "device": "inverter",
+                            "result": inverter.GetCurrentPower(),
+                        }
+                    except ValueError as e:  # Bad ramp rate, nothing was changed
+                        response = {
+                            "status": "error",
+                            "device": "inverter",
+                            "message": str(e),
+                        }
+                elif action == "observe_grid" and value is not None:
+                    # Grid power in W (import positive) for the output calibration
                     response = {
                         "status": "ok",
                         "device": "inverter",
-                        "result": inverter.GetCurrentPower(),
+                        "result": inverter.ObserveGrid(value),
                     }
                 elif action == "get_power":
                     response = {
@@ -97,6 +162,12 @@ def handle_command(payload: dict):
                         "device": "inverter",
                         "result": inverter.GetCurrentPower(),
                     }
+                elif action == "get_stats":
+                    response = {
+                        "status": "ok",
+                        "device": "inverter",
+                        "result": inverter.GetStats(),
+                    }
                 else:
                     response = {
                         "status": "error",
@@ -110,13 +181,23 @@ def handle_command(payload: dict):
                     "message": f"Unknown device: {device}",
                 }
 
+    except RidenUnavailable as e:
+        # Raised immediately while the charger reconnects, so the lock is
+        # never held for long and inverter commands keep flowing
+        response = {
+            "status": "error",
+            "device": "riden",
+            "message": str(e),
+            "health": charger.health(),
+        }
     except Exception as e:
         response = {
             "status": "error",
             "message": f"Exception: {str(e)}",
         }
 
-    print("Response:", response)
+    if payload.get("reply", True):  # Fire-and-forget samples are not logged either
+        print("Response:", response)
     return response
 
 
@@ -129,9 +210,11 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     try:
         payload = json.loads(msg.payload.decode())
-        print("Received command:", payload)
+        if payload.get("reply", True):
+            print("Received command:", payload)
         response = handle_command(payload)
-        client.publish(TOPIC_RESP, json.dumps(response))
+        if payload.get("reply", True):  # Fire-and-forget senders want no reply
+            client.publish(TOPIC_RESP, json.dumps(response))
     except Exception as e:
         err = {"status": "error", "message": f"Exception: {str(e)}"}
         client.publish(TOPIC_RESP, json.dumps(err))
@@ -0,0 +1,144 @@
+"""Driver tests against the pty-backed RidenSimulator.
+
+    cd storage && python -m pytest -q test_riden.py
+"""
+import struct
+import pytest
+from drivers.riden import Riden, RidenUnavailable
+from drivers.riden_array import RidenArray
+from drivers.register import Register as R
+from drivers.rtu import WRITE_MULTIPLE_REGISTERS, WRITE_SINGLE_REGISTER
+from drivers.simulator import RidenSimulator
+
+# No port config on disk, short timeouts, and no reconnect while a test runs
+OPTIONS = dict(port_config=None, timeout=0.05, reconnect_min=60, reconnect_max=60)
+
+
+@pytest.fixture
+def start_sim():
+    sims = []
+
+    def start(**kwargs):
+        sim = RidenSimulator(seed=1, **kwargs)
+        sim.start()
+        sims.append(sim)
+        return sim
+
+    yield start
+    for sim in sims:
+        sim.stop()
+
+
+@pytest.fixture
+def sim(start_sim):
+    return start_sim()
+
+
+@pytest.fixture
+def riden(sim):
+    riden = Riden(port=sim.port, **OPTIONS)
+    yield riden
+    riden._close_serial()
+
+
+def record_functions(sim) -> list:
+    """Function codes of the requests the simulator executes from now on."""
+    functions = []
+    execute = sim._execute
+
+    def recording(function_code, request):
+        functions.append(function_code)
+        return execute(function_code, request)
+
+    sim._execute = recording
+    return functions
+
+
+def i_set_of(sim) -> float:
+    return sim.registers[R.I_SET] / sim.i_multi
+
+
+# ---- Riden ----
+def test_update_costs_two_transactions(riden):
+    before = riden.transactions
+    riden.update()
+    assert riden.transactions - before == 2
+    assert riden.state is not None
+
+
+def test_shadowed_writes_are_skipped(riden, sim):
+    riden.update()
+    state = riden.state
+    functions = record_functions(sim)
+    riden.set_v_set(state.v_set)
+    riden.set_i_set(state.i_set)
+    riden.set_output(state.output)
+    assert functions == []
+
+    riden.set_i_set(2.0)
+    riden.set_i_set(2.0)
+    assert functions == [WRITE_SINGLE_REGISTER]
+    riden.set_i_set(2.0, force=True)
+    assert functions == [WRITE_SINGLE_REGISTER] * 2
+    assert i_set_of(sim) == pytest.approx(2.0)
+
+
+def test_set_vi_is_one_fc16(riden, sim):
+    functions = record_functions(sim)
+    riden.set_vi(53.5, 3.0)
+    assert functions == [WRITE_MULTIPLE_REGISTERS]
+    assert sim.registers[R.V_SET] / sim.v_multi == pytest.approx(53.5)
+    assert i_set_of(sim) == pytest.approx(3.0)
+    riden.set_vi(53.5, 3.0)
+    assert functions == [WRITE_MULTIPLE_REGISTERS]
+
+
+def test_breaker_trips_after_unanswered_requests(riden, sim):
+    sim.drop_rate = 1.0
+    for _ in range(riden.failure_threshold - 1):
+        assert riden.read(R.V_OUT, retries=1) is None
+    with pytest.raises(RidenUnavailable):
+        riden.read(R.V_OUT, retries=1)
+    assert riden.status == "unavailable"
+    requests = sim.requests
+    with pytest.raises(RidenUnavailable):
+        riden.read(R.V_OUT)
+    assert sim.requests == requests  # Nothing goes on the bus while it is down
+
+
+# ---- RidenArray ----
+@pytest.fixture
+def array(start_sim):
+    sims = [start_sim(), start_sim()]
+    array = RidenArray([sim.port for sim in sims], connect="blocking", **OPTIONS)
+    array.set_i_set(36.0)
+    assert [i_set_of(sim) for sim in sims] == pytest.approx([18.0, 18.0])
+    yield array, sims
+    array.close()
+
+
+def test_array_counts_silent_unit_at_its_last_share(array):
+    array, (a, b) = array
+    a.drop_rate = 1.0
+    with pytest.raises(RidenUnavailable):
+        array.set_i_set(18.0)
+    # A may still run 18 A, so B gets nothing
+    assert i_set_of(a) + i_set_of(b) <= 18.0
+    assert i_set_of(b) == 0.0
+
+
+def test_array_reshares_around_unit_refusing_current(array):
+    array, (a, b) = array
+    handle = a.handle
+
+    def refuse_current(request):
+        # A single write of a non-zero I_SET goes unanswered
+        register, value = struct.unpack_from(">HH", request, 2)
+        if request[1] == WRITE_SINGLE_REGISTER and register == R.I_SET and value:
+            return None
+        return handle(request)
+
+    a.handle = refuse_current
+    assert array.set_i_set(18.0) == pytest.approx(18.0)
+    assert i_set_of(a) == 0.0
+    assert i_set_of(b) == pytest.approx(18.0)